@@ -30,12 +30,16 @@ import sys
 import getopt
 import shutil
 import hashlib
+import tempfile
 import unittest
 import subprocess
 
 from xml.dom import minidom
 import xpdeint.minidom_extras
 from xpdeint import CodeParser
+from xpdeint.Features.Transforms import _BesselTransform
+from xpdeint import XSILFile as XSILFileModule
+from xpdeint import Configuration
 
 from xpdeint.XSILFile import XSILFile
 
@@ -240,6 +244,82 @@ def scriptTestingFunction(root, scriptName, testDir, absPath, self):
   lastKnownGoodSourcePath = os.path.join(testDir, simulationName + '_last_known_good.cc')
   file(lastKnownGoodSourcePath, 'w').write(sourceContents)
 
+buildCacheTestScript = """<?xml version="1.0" encoding="UTF-8"?>
+<simulation xmds-version="2">
+  <name>build_cache</name>
+  <features>
+    <globals><![CDATA[ const real scriptID = %(scriptID)s; ]]></globals>
+    <cflags><![CDATA[ %(cflags)s ]]></cflags>
+  </features>
+  <geometry>
+    <propagation_dimension> t </propagation_dimension>
+  </geometry>
+  <vector name="main" type="real">
+    <components> u </components>
+    <initialisation><![CDATA[ u = scriptID; ]]></initialisation>
+  </vector>
+  <sequence>
+    <integrate algorithm="RK4" interval="1.0" steps="10">
+      <samples>1</samples>
+      <operators>
+        <integration_vectors>main</integration_vectors>
+        <![CDATA[ du_dt = -u; ]]>
+      </operators>
+    </integrate>
+  </sequence>
+  <output>
+    <sampling_group initial_sample="yes">
+      <moments>v</moments>
+      <dependencies>main</dependencies>
+      <![CDATA[ v = u; ]]>
+    </sampling_group>
+  </output>
+</simulation>
+"""
+
+class BuildCacheTests(unittest.TestCase):
+  def setUp(self):
+    self.directory = tempfile.mkdtemp()
+    # Make the script unique so that earlier runs of these tests can't have put it in the build cache
+    self.scriptID = repr(float(int(hashlib.sha1(os.urandom(16)).hexdigest()[:8], 16)))
+  
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+  
+  def compile(self, cflags = '-DBUILD_CACHE_TEST=1', options = ''):
+    scriptPath = os.path.join(self.directory, 'build_cache.xmds')
+    file(scriptPath, 'w').write(buildCacheTestScript % dict(scriptID = self.scriptID, cflags = cflags))
+    proc = subprocess.Popen('xmds2 --no-version ' + options + ' "' + scriptPath + '"',
+                            shell=True,
+                            stdout=subprocess.PIPE,
+                            stderr=subprocess.STDOUT,
+                            cwd=self.directory)
+    (stdout, stderr) = proc.communicate()
+    self.assert_(proc.wait() == 0, "Failed to compile.\n" + stdout)
+    self.assert_(os.path.isfile(os.path.join(self.directory, 'build_cache')), "No simulation was produced.\n" + stdout)
+    return stdout
+  
+  def assertCompiled(self, stdout):
+    self.assert_('Compiling simulation...' in stdout and not 'from the build cache' in stdout, stdout)
+  
+  def assertReused(self, stdout):
+    self.assert_('from the build cache' in stdout and not 'Compiling simulation...' in stdout, stdout)
+  
+  def test_identicalCompileHitsCache(self):
+    self.assertCompiled(self.compile())
+    os.remove(os.path.join(self.directory, 'build_cache'))
+    self.assertReused(self.compile())
+  
+  def test_noBuildCacheAlwaysCompiles(self):
+    self.assertCompiled(self.compile())
+    self.assertCompiled(self.compile(options = '--no-build-cache'))
+  
+  def test_changedCFlagsMissCache(self):
+    self.assertCompiled(self.compile())
+    self.assertCompiled(self.compile(cflags = '-DBUILD_CACHE_TEST=2'))
+    self.assertReused(self.compile())
+  
+
 def partial(func, *args, **keywords):
   def newfunc(*fargs, **fkeywords):
     newkeywords = keywords.copy()
@@ -341,6 +421,10 @@ def main(argv=None):
   else:
     suitesToRun.append(testsuites[baseSuiteName])
   suitesToRun.append(unittest.defaultTestLoader.loadTestsFromModule(CodeParser))
+  suitesToRun.append(unittest.defaultTestLoader.loadTestsFromModule(_BesselTransform))
+  suitesToRun.append(unittest.defaultTestLoader.loadTestsFromModule(XSILFileModule))
+  suitesToRun.append(unittest.defaultTestLoader.loadTestsFromModule(Configuration))
+  suitesToRun.append(unittest.defaultTestLoader.loadTestsFromTestCase(BuildCacheTests))
   
   fullSuite = unittest.TestSuite(tests=suitesToRun)
   
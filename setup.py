@@ -39,6 +39,7 @@ setup(name="xmds2",
                     'includes/solirte/*',
                     'support/xpdeint.rng',
                     'support/wscript',
+                    'support/transform_calibration.cc',
                    ]
       },
       
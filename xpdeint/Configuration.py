@@ -24,12 +24,13 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 import os, sys, shutil
 
 from pkg_resources import resource_filename
-from xpdeint.Preferences import xpdeintUserDataPath
+from xpdeint.Preferences import xpdeintUserDataPath, xpdeintBuildCacheSize
 from xpdeint.Utilities import unique
 
-import cPickle, tempfile, shutil, logging
+import cPickle, tempfile, shutil, logging, hashlib, unittest
 
 config_arg_cache_filename = os.path.join(xpdeintUserDataPath, 'xpdeint_config_arg_cache')
+build_cache_path = os.path.join(xpdeintUserDataPath, 'build_cache')
 
 wafdir = os.path.normpath(resource_filename(__name__, 'waf'))
 sys.path.insert(0, wafdir)
@@ -122,6 +123,20 @@ def run_reconfig(includePaths = None, libPaths = None):
     
     return run_config(includePaths = includePaths, libPaths = libPaths)
 
+def available_uselib(variant = 'default'):
+    """
+    Return the list of uselib variables that were found when configuring `variant`.
+    """
+    initialise_waf()
+    
+    cwd = os.getcwd()
+    ctx = Context.create_context('build', top_dir = cwd, run_dir = cwd)
+    ctx.load_envs()
+    
+    if not variant in ctx.all_envs:
+        return []
+    return ctx.all_envs[variant].uselib
+
 def run_build(source_name, target_name, variant = 'default', buildKWs = {}, verbose = False, userCFlags = None):
     initialise_waf()
     
@@ -221,3 +236,163 @@ def run_build(source_name, target_name, variant = 'default', buildKWs = {}, verb
     
     return 0
 
+
+
+def build_cache_key(source_name, variant = 'default', buildKWs = {}, userCFlags = None):
+    """
+    Return the key identifying the compiled form of `source_name` in the build cache.
+    
+    The key covers everything that can change the compiled simulation: the generated source,
+    the xpdeint version and support headers, the build variant, the uselib set, any user
+    CFlags and the waf configuration that was used for the build variant.
+    """
+    from xpdeint.Preferences import versionString
+    from xpdeint.Version import subversionRevisionString
+    
+    h = hashlib.sha1()
+    h.update(file(source_name, 'rb').read())
+    for value in [versionString, subversionRevisionString, variant, userCFlags or '']:
+        h.update('\0' + value)
+    h.update('\0' + ' '.join(sorted(set(buildKWs.get('uselib', [])))))
+    
+    for include_path in buildKWs.get('includes', []):
+        include_path = include_path.replace(r'\ ', ' ')
+        for root, dirs, files in sorted(os.walk(include_path)):
+            dirs.sort()
+            for filename in sorted(files):
+                h.update('\0' + filename)
+                h.update(file(os.path.join(root, filename), 'rb').read())
+    
+    waf_variant_cache_path = os.path.join(xpdeintUserDataPath, 'waf_configure', 'c4che', variant + '_cache.py')
+    if os.path.isfile(waf_variant_cache_path):
+        h.update(file(waf_variant_cache_path, 'rb').read())
+    
+    return h.hexdigest()
+
+def fetch_cached_build(key, target_name):
+    """
+    Copy the cached simulation binary for `key` to `target_name`.
+    Returns `True` if the build cache contained an entry for `key`.
+    """
+    cached_path = os.path.join(build_cache_path, key)
+    if not os.path.isfile(cached_path):
+        return False
+    
+    try:
+        # Mark the entry as recently used so that it is evicted last.
+        os.utime(cached_path, None)
+        temp_fd, temp_path = tempfile.mkstemp(dir = os.path.dirname(os.path.abspath(target_name)) or '.')
+        os.close(temp_fd)
+        shutil.copy2(cached_path, temp_path)
+        os.rename(temp_path, target_name)
+    except (IOError, OSError), err:
+        return False
+    
+    return True
+
+def store_cached_build(key, target_name):
+    """
+    Store the simulation binary `target_name` in the build cache under `key`, then evict
+    the least-recently used entries until the cache fits in `xpdeintBuildCacheSize` bytes.
+    """
+    try:
+        if not os.path.isdir(build_cache_path):
+            os.mkdir(build_cache_path)
+        
+        # Copy to a temporary file and rename so that concurrent xmds2 processes never see partial entries.
+        temp_fd, temp_path = tempfile.mkstemp(dir = build_cache_path, prefix = '.tmp')
+        os.close(temp_fd)
+        shutil.copy2(target_name, temp_path)
+        os.rename(temp_path, os.path.join(build_cache_path, key))
+        
+        entries = []
+        for filename in os.listdir(build_cache_path):
+            if filename.startswith('.tmp'): continue
+            entry_path = os.path.join(build_cache_path, filename)
+            entry_stat = os.stat(entry_path)
+            entries.append((entry_stat.st_mtime, entry_stat.st_size, entry_path))
+        
+        entries.sort()
+        total_size = sum(size for mtime, size, path in entries)
+        for mtime, size, path in entries:
+            if total_size <= xpdeintBuildCacheSize: break
+            # Never evict the entry we have just added
+            if path == os.path.join(build_cache_path, key): continue
+            try:
+                os.remove(path)
+            except OSError, err:
+                continue
+            total_size -= size
+    except (IOError, OSError), err:
+        print "Warning: Unable to store simulation in the xmds2 build cache."
+
+
+# Below are unit tests for the build cache. These tests can be executed by running the
+# xpdeint test suite from 'run_tests.py'
+
+class BuildCacheKeyTests(unittest.TestCase):
+    def setUp(self):
+        self.directory = tempfile.mkdtemp()
+        self.source_name = os.path.join(self.directory, 'simulation.cc')
+        file(self.source_name, 'w').write('int main() { return 0; }\n')
+        include_path = os.path.join(self.directory, 'includes')
+        os.mkdir(include_path)
+        file(os.path.join(include_path, 'xpdeint.h'), 'w').write('#define XPDEINT 1\n')
+        self.buildKWs = {'includes': [include_path], 'uselib': ['optimise', 'hdf5']}
+    
+    def tearDown(self):
+        shutil.rmtree(self.directory)
+    
+    def key(self, **KWs):
+        args = dict(variant = 'default', buildKWs = self.buildKWs, userCFlags = '-DA=1')
+        args.update(KWs)
+        return build_cache_key(self.source_name, **args)
+    
+    def test_identicalBuildsHaveTheSameKey(self):
+        self.assertEqual(self.key(), self.key())
+        self.assertEqual(self.key(), self.key(buildKWs = dict(self.buildKWs, uselib = ['hdf5', 'optimise'])))
+    
+    def test_userCFlagsChangeKey(self):
+        self.assertNotEqual(self.key(), self.key(userCFlags = '-DA=2'))
+        self.assertNotEqual(self.key(), self.key(userCFlags = None))
+    
+    def test_uselibChangesKey(self):
+        self.assertNotEqual(self.key(), self.key(buildKWs = dict(self.buildKWs, uselib = ['optimise'])))
+        self.assertNotEqual(self.key(), self.key(buildKWs = dict(self.buildKWs, uselib = ['optimise', 'hdf5', 'openmp'])))
+    
+    def test_variantChangesKey(self):
+        self.assertNotEqual(self.key(), self.key(variant = 'mpi'))
+    
+    def test_sourceAndHeadersChangeKey(self):
+        key = self.key()
+        file(os.path.join(self.buildKWs['includes'][0], 'xpdeint.h'), 'a').write('#define XPDEINT_EXTRA 1\n')
+        self.assertNotEqual(key, self.key())
+        key = self.key()
+        file(self.source_name, 'a').write('// changed\n')
+        self.assertNotEqual(key, self.key())
+    
+
+class BuildCacheTests(unittest.TestCase):
+    def setUp(self):
+        global build_cache_path
+        self.directory = tempfile.mkdtemp()
+        self.original_build_cache_path = build_cache_path
+        build_cache_path = os.path.join(self.directory, 'build_cache')
+        self.target_name = os.path.join(self.directory, 'simulation')
+        file(self.target_name, 'wb').write('compiled simulation')
+    
+    def tearDown(self):
+        global build_cache_path
+        build_cache_path = self.original_build_cache_path
+        shutil.rmtree(self.directory)
+    
+    def test_storedBuildIsFetched(self):
+        store_cached_build('a' * 40, self.target_name)
+        os.remove(self.target_name)
+        self.assertTrue(fetch_cached_build('a' * 40, self.target_name))
+        self.assertEqual(file(self.target_name, 'rb').read(), 'compiled simulation')
+    
+    def test_otherKeysMiss(self):
+        store_cached_build('a' * 40, self.target_name)
+        self.assertFalse(fetch_cached_build('b' * 40, self.target_name))
+    
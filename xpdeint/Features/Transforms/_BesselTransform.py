@@ -25,12 +25,17 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from xpdeint.Features.Transforms.MMT import MMT
 
 from xpdeint.Features.Transforms.BesselBasis import BesselBasis
+from xpdeint.Features.Transforms.BesselFFTLogBasis import BesselFFTLogBasis
 
 from xpdeint.Geometry.BesselDimensionRepresentation import BesselDimensionRepresentation
 from xpdeint.Geometry.BesselNeumannDimensionRepresentation import BesselNeumannDimensionRepresentation
 from xpdeint.Geometry.SphericalBesselDimensionRepresentation import SphericalBesselDimensionRepresentation
+from xpdeint.Geometry.LogarithmicDimensionRepresentation import LogarithmicDimensionRepresentation
+
+import unittest
 
 from xpdeint.ParserException import ParserException, error_missing_python_library
+from xpdeint.Utilities import BoundedCache
 
 # We don't directly import mpmath so that mpmath isn't a requirement for xpdeint
 # unless you use MMT's.
@@ -73,49 +78,121 @@ def require_scipy():
     except ImportError:
       error_missing_python_library("scipy")
 
+def besselZeroInitialGuesses(m, a, b, derivative):
+  """
+  Return approximations to the `a`th to `b`th zeros of J_m(x) (or J'_m(x) if `derivative`).
+  For small orders McMahon's asymptotic expansion is accurate for all zeros. For larger orders
+  we use the leading term of the expansion that is uniform in the index of the zero,
+  j_{m,k} ~ m z(zeta) where zeta = m^(-2/3) a_k and a_k is the kth zero of Ai(x) (or Ai'(x)),
+  and z(zeta) is the solution of (2/3)(-zeta)^(3/2) = sqrt(z^2 - 1) - arcsec(z).
+  """
+  k = numpy.arange(a, b+1, dtype = numpy.double)
+  if m < 2.0:
+    mu = 4.0 * m * m
+    if derivative:
+      beta = (k + 0.5 * m - 0.75) * numpy.pi
+      return beta - (mu + 3.0) / (8.0 * beta) - 4.0 * (7.0 * mu * mu + 82.0 * mu - 9.0) / (3.0 * (8.0 * beta) ** 3)
+    else:
+      beta = (k + 0.5 * m - 0.25) * numpy.pi
+      return beta - (mu - 1.0) / (8.0 * beta) - 4.0 * (mu - 1.0) * (7.0 * mu - 31.0) / (3.0 * (8.0 * beta) ** 3)
+  
+  airyZeros = scipy.special.ai_zeros(b)[1 if derivative else 0][a-1:]
+  rhs = (2.0 / 3.0) * (-airyZeros / m ** (2.0 / 3.0)) ** 1.5
+  # Start from the asymptotic forms of z for small and large rhs and refine with Newton's method
+  z = numpy.maximum(1.0 + (1.5 * rhs) ** (2.0 / 3.0) / 2.0 ** (1.0 / 3.0), rhs)
+  for iteration in xrange(50):
+    root = numpy.sqrt(z * z - 1.0)
+    step = (root - numpy.arccos(1.0 / z) - rhs) * z / root
+    z = numpy.maximum(z - step, 1.0 + 0.5 * (z - 1.0))
+  return m * z
+
+def besselZerosAreValid(m, zeros, guesses):
+  """
+  Return whether `zeros` are consecutive zeros of a Bessel function of order `m` given approximations
+  `guesses` to them. All zeros are greater than m, and they must be strictly increasing. The spacing
+  between zeros isn't close to pi for large orders, so instead the spacing must agree with that of the
+  guesses. A double root or a missed root would halve or double the spacing.
+  """
+  zeros = numpy.asarray(zeros, dtype = numpy.double)
+  if len(zeros) and not zeros[0] > m:
+    return False
+  separations = numpy.diff(zeros)
+  guessSeparations = numpy.diff(guesses)
+  return bool(numpy.all(separations > 0.0) and numpy.all(numpy.abs(separations - guessSeparations) < 0.5 * guessSeparations))
+
+def besselZerosByNewton(m, a, b, derivative):
+  """
+  Return the `a`th to `b`th zeros of J_m(x) (or J'_m(x) if `derivative`) as a numpy array,
+  or None if Newton's method didn't converge to the correct zeros.
+  """
+  guesses = besselZeroInitialGuesses(m, a, b, derivative)
+  zeros = guesses.copy()
+  for iteration in xrange(100):
+    if derivative:
+      step = scipy.special.jvp(m, zeros, 1) / scipy.special.jvp(m, zeros, 2)
+    else:
+      step = scipy.special.jv(m, zeros) / scipy.special.jvp(m, zeros, 1)
+    zeros -= step
+    # Newton's method converges quadratically, so after a step this small the zeros are only limited by rounding
+    if numpy.all(numpy.abs(step) <= 1e-14 * zeros):
+      break
+  else:
+    return None
+  if not besselZerosAreValid(m, zeros, guesses):
+    return None
+  return zeros
+
 def besselJZeros(m, a, b):
+  require_scipy()
+  zeros = besselZerosByNewton(m, a, b, derivative = False)
+  if zeros is not None:
+    return map(float, zeros)
+  # Fall back to mpmath, which is much slower but more robust
   require_mpmath()
   if not hasattr(mpmath, 'besseljzero'):
     besseljn = lambda x: mpmath.besselj(m, x)
     results = [mpmath.findroot(besseljn, mpmath.pi*(kp - 1./4 + 0.5*m)) for kp in range(a, b+1)]
   else:
     results = [mpmath.besseljzero(m, i) for i in xrange(a, b+1)]
-  # Check that we haven't found double roots or missed a root. All roots should be separated by approximately pi
-  assert all([0.6*mpmath.pi < (b - a) < 1.4*mpmath.pi for a, b in zip(results[:-1], results[1:])]), "Separation of Bessel zeros was incorrect."
+  results = map(float, results)
+  # Check that we haven't found double roots or missed a root
+  assert besselZerosAreValid(m, results, besselZeroInitialGuesses(m, a, b, derivative = False)), \
+    "Separation of Bessel zeros was incorrect."
   return results
 
 def besselJPrimeZeros(m, a, b):
+  require_scipy()
+  if m == 0:
+    # J_0'(x) = -J_1(x), and x = 0 is counted as the first zero of J_0'(x)
+    return ([0.0] if a == 1 else []) + besselJZeros(1, max(a - 1, 1), b - 1)
+  zeros = besselZerosByNewton(m, a, b, derivative = True)
+  if zeros is not None:
+    return map(float, zeros)
+  # Fall back to mpmath, which is much slower but more robust
   require_mpmath()
   results = [mpmath.besseljzero(m, i, derivative=1) for i in xrange(a, b+1)]
-  return results
+  return map(float, results)
 
 def besselNeumannMatrix(m, besseljzeros, besselValues, S):
   require_scipy()
-  N = len(besseljzeros)
-  matrix = numpy.zeros([N, N])
-  for i in xrange(N):
-    for j in xrange(N):
-      matrix[i,j] = (2.0 / S) * scipy.special.jn(m, besseljzeros[i] * besseljzeros[j] / S) \
-          / (besselValues[i] * besselValues[j])
-  return matrix
+  return (2.0 / S) * scipy.special.jv(m, numpy.outer(besseljzeros, besseljzeros) / S) \
+      / numpy.outer(besselValues, besselValues)
   
 def besselNeumannSFactor(m, besseljzeros):
   require_scipy()
+  besseljzeros = numpy.array(besseljzeros)
   besseljzeros_for_matrix = besseljzeros[:-1]
   N = len(besseljzeros_for_matrix)
   print "Computing the Bessel-Neumann transform S factor for lattice size %i (this will be performed once and saved for each lattice size)..." % (N)
-  besselValues = []
-  for i in xrange(N):
-    x = numpy.abs(scipy.special.jn(m, besseljzeros[i]))
-    if m > 0:
-      x *= numpy.sqrt(1.0 - m*m / (besseljzeros[i] * besseljzeros[i]))
-    besselValues.append(x)
-
+  besselValues = numpy.abs(scipy.special.jv(m, besseljzeros_for_matrix))
+  if m > 0:
+    besselValues *= numpy.sqrt(1.0 - m*m / (besseljzeros_for_matrix * besseljzeros_for_matrix))
+  
   def f(S):
+    # The logarithm of the determinant doesn't overflow for large matrices
     matrix = besselNeumannMatrix(m, besseljzeros_for_matrix, besselValues, S)
-    determinant = numpy.linalg.det(matrix)
-    result = numpy.abs(determinant) - 1.0
-    return result
+    sign, logDeterminant = numpy.linalg.slogdet(matrix)
+    return logDeterminant
   
   S, results = scipy.optimize.brentq(f, besseljzeros[-2], besseljzeros[-1], full_output=True)
   return S
@@ -128,9 +205,12 @@ class _BesselTransform(MMT):
     MMT.__init__(self, *args, **KWs)
     dataCache = self.getVar('dataCache')
     
-    self.besselJZeroCache = dataCache.setdefault('besselJZeros', {})
-    self.besselJPrimeZeroCache = dataCache.setdefault('besselJPrimeZeros', {})
-    self.besselNeumannSCache = dataCache.setdefault('besselNeumannSFactor', {})
+    # Bessel zeros are cheap to compute, so they are no longer kept in the data cache
+    dataCache.pop('besselJZeros', None)
+    dataCache.pop('besselJPrimeZeros', None)
+    self.besselJZeroCache = {}
+    self.besselJPrimeZeroCache = {}
+    self.besselNeumannSCache = BoundedCache.inDataCache(dataCache, 'besselNeumannSFactor', maxEntries = 64)
   
   def newDimension(self, name, lattice, minimum, maximum,
                    parent, transformName, aliases = set(),
@@ -138,7 +218,7 @@ class _BesselTransform(MMT):
                    type = 'real', volumePrefactor = None,
                    xmlElement = None):
     assert type == 'real'
-    assert transformName in ['bessel', 'spherical-bessel', 'bessel-neumann']
+    assert transformName in ['bessel', 'spherical-bessel', 'bessel-neumann', 'bessel-fftlog']
     if not spectralLattice:
       spectralLattice = lattice
     dim = super(_BesselTransform, self).newDimension(name, max(lattice, spectralLattice), minimum, maximum,
@@ -160,6 +240,11 @@ class _BesselTransform(MMT):
       else:
         if order < 0:
           raise ParserException(xmlElement, "The 'order' attribute for Bessel transforms must be non-negative integers.")
+    
+    if transformName == 'bessel-fftlog':
+      self.addLogarithmicRepresentations(dim, order, lattice, spectralLattice, minimum, maximum, xmlElement)
+      return dim
+    
     orderOffset = 0
     dimRepClass = BesselDimensionRepresentation
     if transformName == 'bessel-neumann':
@@ -210,29 +295,126 @@ class _BesselTransform(MMT):
     
     return dim
   
+  def addLogarithmicRepresentations(self, dim, order, lattice, spectralLattice, minimum, maximum, xmlElement):
+    """
+    Add the representations of a 'bessel-fftlog' dimension to `dim`. The points are spaced
+    uniformly in log(r) and log(k) so that the transform can be done with FFTs.
+    """
+    name = dim.name
+    if spectralLattice != lattice:
+      raise ParserException(xmlElement, "The 'bessel-fftlog' transform doesn't support a 'spectral_lattice' attribute.")
+    try:
+      if float(minimum) <= 0.0:
+        raise ParserException(xmlElement, "The domain for 'bessel-fftlog' transform dimensions must begin at a positive radius.")
+    except ValueError:
+      # The domain will be checked at run time
+      pass
+    
+    # The FFTs are done with FFTW
+    self.fftwTransform = self.getVar('features')['TransformMultiplexer'].transformWithName('dft')
+    
+    self.basisMap[name] = dict(
+      order = order,
+      lattice = lattice,
+      transformations = dict([
+        ((name, 'k' + name), BesselFFTLogBasis(parent = self, **self.argumentsToTemplateConstructors))
+      ])
+    )
+    
+    logStep = '(log((real)(%(maximum)s) / (%(minimum)s)) / (%(lattice)s - 1))' % locals()
+    
+    # Real space representation
+    xspace = LogarithmicDimensionRepresentation(name = name, type = 'real', runtimeLattice = lattice,
+                                                stepSizeArray = True, parent = dim,
+                                                tag = self.coordinateSpaceTag,
+                                                _firstPoint = minimum, _logStep = logStep, _order = order,
+                                                **self.argumentsToTemplateConstructors)
+    dim.addRepresentation(xspace)
+    
+    # Spectral space representation. The grid is chosen so that k_j r_{N-j} is constant.
+    kspace = LogarithmicDimensionRepresentation(name = 'k' + name, type = 'real', runtimeLattice = lattice,
+                                                stepSizeArray = True, parent = dim,
+                                                _firstPoint = '(_fftlog_low_ringing_kr(%(order)s, %(logStep)s) / (%(minimum)s) '
+                                                              '* exp(-%(lattice)s * %(logStep)s))' % locals(),
+                                                _logStep = logStep, _order = order,
+                                                reductionMethod = LogarithmicDimensionRepresentation.ReductionMethod.fixedStep,
+                                                tag = self.spectralSpaceTag,
+                                                **self.argumentsToTemplateConstructors)
+    dim.addRepresentation(kspace)
+  
   def besselJZeros(self, m, k):
-    if not m in self.besselJZeroCache:
+    if len(self.besselJZeroCache.get(m, [])) < k:
       self.besselJZeroCache[m] = besselJZeros(m, 1, k)
-    else:
-      if len(self.besselJZeroCache[m]) < k:
-        self.besselJZeroCache[m].extend(besselJZeros(m, len(self.besselJZeroCache[m])+1, k))
-    
     return self.besselJZeroCache[m][:k]
   
   def besselJPrimeZeros(self, m, k):
-    if not m in self.besselJPrimeZeroCache:
+    if len(self.besselJPrimeZeroCache.get(m, [])) < k:
       self.besselJPrimeZeroCache[m] = besselJPrimeZeros(m, 1, k)
-    else:
-      if len(self.besselJPrimeZeroCache[m]) < k:
-        self.besselJPrimeZeroCache[m].extend(besselJPrimeZeros(m, len(self.besselJPrimeZeroCache[m])+1, k))
-    
     return self.besselJPrimeZeroCache[m][:k]
   
   def besselNeumannSFactor(self, m, k):
     require_numpy()
     if not (m, k) in self.besselNeumannSCache:
-      zeros = map(numpy.double, self.besselJPrimeZeros(m, k+1))
-      S = besselNeumannSFactor(m, zeros)
+      S = besselNeumannSFactor(m, self.besselJPrimeZeros(m, k+1))
       self.besselNeumannSCache[(m, k)] = float(S)
     
     return self.besselNeumannSCache[(m, k)]
+    
+
+# Below are unit tests for the Bessel zeros. These tests can be executed by directly
+# executing this file, or by running the xpdeint test suite from 'run_tests.py'
+
+class BesselZerosTests(unittest.TestCase):
+  def setUp(self):
+    require_scipy()
+  
+  def assertZerosEqual(self, zeros, expected):
+    self.assertEqual(len(zeros), len(expected))
+    self.assertTrue(numpy.allclose(zeros, expected, rtol = 1e-13, atol = 0.0))
+  
+  def test_lowOrder(self):
+    self.assertZerosEqual(besselJZeros(0, 1, 100), scipy.special.jn_zeros(0, 100))
+    self.assertZerosEqual(besselJPrimeZeros(1, 1, 100), scipy.special.jnp_zeros(1, 100))
+  
+  def test_derivativeOfOrderZero(self):
+    self.assertZerosEqual(besselJPrimeZeros(0, 1, 100), [0.0] + list(scipy.special.jnp_zeros(0, 99)))
+  
+  def test_highOrders(self):
+    for m in [20, 50, 100]:
+      self.assertZerosEqual(besselJZeros(m, 1, 200), scipy.special.jn_zeros(m, 200))
+      self.assertZerosEqual(besselJPrimeZeros(m, 1, 200), scipy.special.jnp_zeros(m, 200))
+  
+  def test_partialRange(self):
+    self.assertZerosEqual(besselJZeros(50, 41, 60), scipy.special.jn_zeros(50, 60)[40:])
+    self.assertZerosEqual(besselJPrimeZeros(100, 41, 60), scipy.special.jnp_zeros(100, 60)[40:])
+  
+  def test_newtonFindsHighOrderZeros(self):
+    # The mpmath fallback would find the same zeros, but much more slowly
+    for m in [50, 100]:
+      self.assertIsNotNone(besselZerosByNewton(m, 1, 200, derivative = False))
+      self.assertIsNotNone(besselZerosByNewton(m, 1, 200, derivative = True))
+  
+  def test_invalidZeros(self):
+    zeros = scipy.special.jn_zeros(50, 20)
+    guesses = besselZeroInitialGuesses(50, 1, 20, derivative = False)
+    self.assertTrue(besselZerosAreValid(50, zeros, guesses))
+    # A double root
+    doubleRoot = zeros.copy()
+    doubleRoot[5] = doubleRoot[4]
+    self.assertFalse(besselZerosAreValid(50, doubleRoot, guesses))
+    # A missed root
+    missedRoot = numpy.concatenate((zeros[:5], zeros[6:], zeros[-1:] + numpy.pi))
+    self.assertFalse(besselZerosAreValid(50, missedRoot, guesses))
+  
+  def test_mpmathFallback(self):
+    global besselZerosByNewton
+    newton = besselZerosByNewton
+    besselZerosByNewton = lambda m, a, b, derivative: None
+    try:
+      self.assertZerosEqual(besselJZeros(50, 1, 30), scipy.special.jn_zeros(50, 30))
+    finally:
+      besselZerosByNewton = newton
+  
+
+if __name__ == '__main__':
+  unittest.main()
@@ -139,6 +139,10 @@ class _FourierTransformFFTW3 (_Transform):
     untransformedDimReps = dict([(dimName, geometry.dimensionWithName(dimName).representations[0]) for dimName in dimNames])
     cost = sum([int(math.ceil(math.log(untransformedDimReps[dimName].latticeEstimate))) for dimName in dimNames], 0)
     cost *= reduce(operator.mul, [untransformedDimReps[dimName].latticeEstimate for dimName in dimNames], 1)
+    if all([self.transformNameMap[dimName] == 'dft' for dimName in dimNames]):
+      cost *= self.transformCosts['complexFFT']
+    else:
+      cost *= self.transformCosts['realFFT']
     return cost
   
   @staticmethod
@@ -154,6 +158,7 @@ class _FourierTransformFFTW3 (_Transform):
     
     transformFunctions = dict(
       geometryDependent = True,
+      batchable = True,
       transformFunction = self.transformFunction,
     )
     
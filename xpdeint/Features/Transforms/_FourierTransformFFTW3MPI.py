@@ -31,6 +31,9 @@ import operator
 from itertools import groupby
 
 class _FourierTransformFFTW3MPI (FourierTransformFFTW3):
+  # Set by the parser when FFTW should use threads (from the 'threads' attribute of the 'fftw' feature, or OpenMP)
+  threadCount = None
+  
   def preflight(self):
     super(_FourierTransformFFTW3MPI, self).preflight()
     
@@ -89,6 +92,27 @@ class _FourierTransformFFTW3MPI (FourierTransformFFTW3):
       return False
     return field.hasDimension(self.mpiDimensions[0]) and field.hasDimension(self.mpiDimensions[1])
   
+  @lazy_property
+  def threadsSuffix(self):
+    """The suffix of the FFTW library that provides threads."""
+    return 'omp' if 'OpenMP' in self.getVar('features') else 'threads'
+  
+  @lazy_property
+  def uselib(self):
+    result = [self.fftwLibVersionName, self.fftwLibVersionName + '_' + self.fftwSuffix]
+    if self.threadCount:
+      result.append(self.fftwLibVersionName + '_' + self.threadsSuffix)
+    return result
+  
+  @property
+  def wisdomThreadCount(self):
+    return '_num_threads' if self.threadCount else '1'
+  
+  @property
+  def transposeChunks(self):
+    """The number of pieces each distributed transform and transpose is split into (1 means that FFTW does them)."""
+    return self._driver.transposeChunks
+  
   @lazy_property
   def hasFFTWDistributedTransforms(self):
     geometry = self.getVar('geometry')
@@ -32,6 +32,7 @@ from xpdeint.Geometry.UniformDimensionRepresentation import UniformDimensionRepr
 from xpdeint.Geometry.HermiteGaussDimensionRepresentation import HermiteGaussDimensionRepresentation
 
 from xpdeint.ParserException import ParserException
+from xpdeint.Utilities import BoundedCache
 
 # We don't directly import numpy so that numpy isn't a requirement for xpdeint
 # unless you use MMT's.
@@ -122,7 +123,9 @@ class _HermiteGaussTransform(MMT):
     MMT.__init__(self, *args, **KWs)
     dataCache = self.getVar('dataCache')
     
-    self.hermiteCache = dataCache.setdefault('hermiteGauss', {})
+    dataCache.pop('hermiteGauss', None)
+    self.hermiteZerosCache = BoundedCache.inDataCache(dataCache, 'hermiteGaussZeros', maxEntries = 64)
+    self.hermiteWeightsCache = BoundedCache.inDataCache(dataCache, 'hermiteGaussWeights', maxEntries = 64)
   
   def newDimension(self, name, lattice, minimum, maximum,
                    parent, transformName, aliases = set(),
@@ -209,15 +212,13 @@ class _HermiteGaussTransform(MMT):
     return dim
   
   def hermiteZeros(self, n):
-    zerosCache = self.hermiteCache.setdefault('zeros',{})
-    if not n in zerosCache:
-      zerosCache[n] = hermiteZeros(n)
-    return zerosCache[n]
+    if not n in self.hermiteZerosCache:
+      self.hermiteZerosCache[n] = hermiteZeros(n)
+    return self.hermiteZerosCache[n]
   
   def hermiteGaussWeights(self, n):
-    weightsCache = self.hermiteCache.setdefault('weights',{})
-    if not n in weightsCache:
-      weightsCache[n] = hermiteGaussWeightsFromZeros(n, self.hermiteZeros(n))
-    return weightsCache[n]
+    if not n in self.hermiteWeightsCache:
+      self.hermiteWeightsCache[n] = hermiteGaussWeightsFromZeros(n, self.hermiteZeros(n))
+    return self.hermiteWeightsCache[n]
   
 
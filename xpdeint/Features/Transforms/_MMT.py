@@ -67,6 +67,7 @@ class _MMT (_Transform):
             outOfPlace = outOfPlace,
             transformFunction = basis.transformFunction,
             transformType = basis.matrixType,
+            geometryDependent = basis.geometryDependent,
           ))
         addTransform(True)
         if basis.supportsInPlaceOperation:
@@ -40,6 +40,7 @@ class _TransformMultiplexer (_Feature):
     self.availableTransformations = []
     self.neededTransformations = []
     self.transformations = []
+    self.transformBatches = []
   
   def transformWithName(self, name):
     if not name in self.transformClasses:
@@ -52,6 +53,11 @@ class _TransformMultiplexer (_Feature):
     else:
       return cls(parent = self.simulation, **self.argumentsToTemplateConstructors)
   
+  @property
+  def planningTransforms(self):
+    """The transforms that save wisdom when they have been planned (see ``xmds2 --plan-wisdom``)."""
+    return [t for t in self.transforms if t.hasattr('planningFinished')]
+  
   def __getattribute__(self, name):
     """
     Call through to all methods on the child transforms. This should only be used for
@@ -108,8 +114,9 @@ class _TransformMultiplexer (_Feature):
     self.oopCopy = dict(
       owner = self,
       transformations = [tuple()],
-      cost = 1,
+      cost = self.transformCosts['copy'],
       outOfPlace = True,
+      batchable = True,
       transformFunction = self.oopCopyTransformFunction,
       description = 'Out-of-place copy',
     )
@@ -119,8 +126,9 @@ class _TransformMultiplexer (_Feature):
     self.ipMultiply = dict(
       owner = self,
       transformations = [tuple()],
-      cost = 1,
+      cost = self.transformCosts['inPlaceMultiply'],
       scaling = True,
+      batchable = True,
       transformFunction = self.ipMultiplyTransformFunction,
       description = 'In-place multiply',
     )
@@ -129,9 +137,10 @@ class _TransformMultiplexer (_Feature):
     self.oopMultiply = dict(
       owner = self,
       transformations = [tuple()],
-      cost = 2,
+      cost = self.transformCosts['outOfPlaceMultiply'],
       outOfPlace = True,
       scaling = True,
+      batchable = True,
       transformFunction = self.oopMultiplyTransformFunction,
       description = 'Out-of-place multiply',
     )
@@ -349,6 +358,7 @@ class _TransformMultiplexer (_Feature):
       self.vectorTransformMap[vector] = dict(
         bases = vectorBases,
         basisPairMap = dict(),
+        batchable = True,
       )
       vector.transformMap = self.vectorTransformMap[vector]
       
@@ -374,6 +384,8 @@ class _TransformMultiplexer (_Feature):
           geometrySpecification = None
           transformation = self.availableTransformations[transformID]
           transformation.setdefault('vectors', set()).add(vector)
+          if not transformation.get('batchable', False):
+            self.vectorTransformMap[vector]['batchable'] = False
           
           resultBasis, (prefixBasis, matchedSourceBasis, postfixBasis) = transformedBasis(currentBasis, transformPair)
           forward = True
@@ -513,5 +525,57 @@ class _TransformMultiplexer (_Feature):
       f.transformFunctionArgs = [tID, transform, f]
       self.functions[functionName] = f
       transform['owner'].transformations.append((tID, transform))
+    
+    # Vectors on the same field that need the same transforms can be stored contiguously and transformed
+    # together. The loop over the vectors is then just part of the prefix lattice of each transform step,
+    # so an FFT of a batch of vectors is a single (larger) FFTW plan instead of one plan execution per vector.
+    # Only transforms that preserve the size of the vector can be batched this way.
+    batchMap = dict()
+    for vector in vectors:
+      transformInfo = self.vectorTransformMap[vector]
+      if not transformInfo['batchable'] or vector.aliases or vector.isNoise \
+         or vector.field.isDistributed or not vector in vector.field.managedVectors:
+        continue
+      transformSteps = tuple(sorted(
+        (basisPairInfo['basisPair'], tuple(transformStep[0:4] for transformStep in basisPairInfo['transformSteps']))
+          for basisPairInfo in transformInfo['basisPairMap'].values()
+      ))
+      batchKey = (vector.field.name, vector.type, vector.nComponents, tuple(transformInfo['bases']), transformSteps)
+      batchMap.setdefault(batchKey, []).append(vector)
+    
+    self.transformBatches = []
+    for batchKey in sorted(batchMap):
+      batchVectors = batchMap[batchKey]
+      if len(batchVectors) < 2:
+        continue
+      batchVectors.sort(key = lambda v: v.id)
+      field = batchVectors[0].field
+      transformSteps = [transformStep for basisPairInfo in self.vectorTransformMap[batchVectors[0]]['basisPairMap'].values()
+                                       for transformStep in basisPairInfo['transformSteps']]
+      geometryDependentSteps = []
+      for transformStep in transformSteps:
+        if self.neededTransformations[transformStep[0]].get('geometryDependent', False) \
+           and not transformStep in geometryDependentSteps:
+          geometryDependentSteps.append(transformStep)
+      batch = dict(
+        id = '%s_transform_batch_%i' % (field.name, len(field.transformBatches)),
+        vectors = batchVectors,
+        type = batchVectors[0].type,
+        needsAuxiliaryArray = any([transformStep[2] for transformStep in transformSteps]),
+        geometryDependentSteps = geometryDependentSteps,
+      )
+      field.transformBatches.append(batch)
+      self.transformBatches.append(batch)
+      for vector in batchVectors:
+        vector.transformBatch = batch
+      
+      functionName = '_' + batch['id'] + '_basis_transform'
+      f = Function(name = functionName,
+                   args = [('ptrdiff_t', 'new_basis')],
+                   implementation = self.batchBasisTransformFunctionContents,
+                   description = 'batched basis transform for vectors ' + ', '.join(v.name for v in batchVectors))
+      f.batch = batch
+      batch['function'] = f
+      self.functions[functionName] = f
   
 
@@ -19,6 +19,8 @@ import BesselTransform
 transformClasses.update([(name, BesselTransform.BesselTransform) for name in ['bessel', 'spherical-bessel']])
 import BesselNeumannTransform
 transformClasses['bessel-neumann'] = BesselNeumannTransform.BesselNeumannTransform
+import BesselFFTLogTransform
+transformClasses['bessel-fftlog'] = BesselFFTLogTransform.BesselFFTLogTransform
 
 import HermiteGaussTransform
 transformClasses['hermite-gauss'] = HermiteGaussTransform.HermiteGaussTransform
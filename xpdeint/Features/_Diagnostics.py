@@ -26,8 +26,18 @@ from xpdeint.Features._Feature import _Feature
 
 from xpdeint.Geometry.UniformDimensionRepresentation import UniformDimensionRepresentation
 from xpdeint.Function import Function
+from xpdeint.Segments.Integrators.AdaptiveStep import AdaptiveStep as AdaptiveStepIntegrator
 
 class _Diagnostics (_Feature):
+  # The number of steps of the step-size controller of each adaptive integrator recorded in the XSIL file
+  controllerHistoryLength = 16
+  
+  def preflight(self):
+    super(_Diagnostics, self).preflight()
+    
+    self.adaptiveIntegrators = [ai for ai in self.getVar('templates') if isinstance(ai, AdaptiveStepIntegrator)]
+    self.adaptiveIntegrators.sort(key = lambda ai: ai.segmentNumber)
+  
   def nonlocalAccess(self, dict):
     """
     The purpose of this function is to safety-check nonlocal dimension access. The only place where this is potentially
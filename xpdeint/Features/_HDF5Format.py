@@ -29,4 +29,36 @@ class _HDF5Format (OutputFormat, HDF5):
   def __init__(self, *args, **KWs):
     OutputFormat.__init__(self, *args, **KWs)
     HDF5.__init__(self, *args, **KWs)
+    
+    # Map of dimension names to the number of points of that dimension in each chunk
+    self.chunkShape = {}
+    self.chunkCacheSize = None
+    self.compression = None
+    self.compressionLevel = 4
+    self.shuffle = True
+  
+  def chunkLatticeForField(self, field):
+    """
+    Return a list of the number of points in each chunk for each dimension of `field`,
+    or `None` if the datasets for `field` should be stored contiguously.
+    
+    A dimension that isn't divided into chunks has an entry of `None`. The propagation
+    dimension is divided into chunks of a single sample unless another size is given,
+    which is represented by an entry of `0`.
+    """
+    if not field.dimensions:
+      # Scalar datasets can't be chunked
+      return None
+    propagationDimension = self.getVar('propagationDimension')
+    chunkLattice = []
+    for dim in field.dimensions:
+      if dim.name in self.chunkShape:
+        chunkLattice.append(self.chunkShape[dim.name])
+      elif dim.name == propagationDimension:
+        chunkLattice.append(0)
+      else:
+        chunkLattice.append(None)
+    if all([lattice is None for lattice in chunkLattice]) and not self.compression:
+      return None
+    return chunkLattice
   
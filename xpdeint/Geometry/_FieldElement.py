@@ -42,6 +42,7 @@ class _FieldElement (ScriptElement):
     # Set default variables
     self.managedVectors = set()
     self.temporaryVectors = set()
+    self.transformBatches = []
     self.dimensions = []
     self._basisForBasisCache = {}
     
@@ -8,3 +8,9 @@ if 'XMDS_USER_DATA' in os.environ:
     xpdeintUserDataPath = os.environ['XMDS_USER_DATA']
 else:
     xpdeintUserDataPath = os.path.join(os.path.expanduser('~'), '.xmds')
+
+# The maximum total size (in bytes) of compiled simulations kept in the build cache.
+if 'XMDS_BUILD_CACHE_SIZE' in os.environ:
+    xpdeintBuildCacheSize = int(os.environ['XMDS_BUILD_CACHE_SIZE']) * 1024 * 1024
+else:
+    xpdeintBuildCacheSize = 512 * 1024 * 1024
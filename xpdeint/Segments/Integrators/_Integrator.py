@@ -27,7 +27,7 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from xpdeint.Segments._Segment import _Segment
 
 from xpdeint.Operators.NonConstantIPOperator import NonConstantIPOperator
-from xpdeint.ParserException import ParserException
+from xpdeint.ParserException import ParserException, parserWarning
 from xpdeint.Utilities import lazy_property, leastCommonMultiple
 from xpdeint.Function import Function
 from itertools import chain
@@ -36,6 +36,8 @@ class _Integrator (_Segment):
   
   canBeInitialisedEarly = True
   supportsConstantIPOperators = True
+  isAdaptive = False
+  supportsFusedStages = True
   
   def __init__(self, stepperClass, *args, **KWs):
     _Segment.__init__(self, *args, **KWs)
@@ -54,6 +56,7 @@ class _Integrator (_Segment):
     self.stepper = stepperClass(parent = self, **self.argumentsToTemplateConstructors)
     self._children.append(self.stepper)
     self.only_when_called = False
+    self.fuseStages = False
     
     functionNamePrefix = '_' + self.id
     
@@ -99,6 +102,48 @@ class _Integrator (_Segment):
             self.dynamicVectorsNeedingPrecalculationForOperatorContainers(self.intraStepOperatorContainers), 
             static = False, predicate = lambda x: x.isComputed or x.isNoise) if vector.isNoise]
 
+  @lazy_property
+  def fusedStages(self):
+    """
+    Returns True if the stage updates of the stepper are evaluated in the same lattice sweep
+    as the delta a operators.
+    
+    The stage updates only involve the values of the integration vectors at a single point,
+    so they can be moved into the delta a sweep as long as nothing between the delta a
+    operator and the stage update changes the integration vectors, and the delta a operator
+    doesn't read any integration vector at a point other than the current one.
+    """
+    if not self.fuseStages:
+      return False
+    
+    reason = None
+    deltaAOperators = [oc.deltaAOperator for oc in self.intraStepOperatorContainers if oc.deltaAOperator]
+    if not self.supportsFusedStages or not self.stepper.supportsFusedStages:
+      reason = "the %s algorithm doesn't support them" % self.stepper.name()
+    elif getattr(self, 'cross', False):
+      reason = "they can't be used for cross-propagation"
+    elif any(oc.ipOperators for oc in self.operatorContainers):
+      reason = "they can't be used with IP operators"
+    elif any(oc.postDeltaAOperators for oc in self.intraStepOperatorContainers if oc.deltaAOperator):
+      reason = "they can't be used with operators that follow the delta a operator"
+    else:
+      for op in deltaAOperators:
+        if op.deltaAField:
+          reason = "integration vectors are accessed nonlocally"
+        elif any(not v.field == op.primaryCodeBlock.field for v in op.integrationVectors):
+          reason = "the delta a operators must loop over the field of their integration vectors"
+        elif not op.operatorBasis == op.primaryCodeBlock.field.basisForBasis(self.homeBasis):
+          reason = "the delta a operators must be evaluated in the home basis of the integrator"
+        elif any(v in other.integrationVectors for other in deltaAOperators if not other is op for v in op.dependencies):
+          reason = "an integration vector of one delta a operator is used by another"
+        if reason:
+          break
+    
+    if reason:
+      parserWarning(self.xmlElement, "Fused stages have been turned off for this integrator because %s." % reason)
+      return False
+    return True
+  
   @lazy_property
   def extraIntegrationArrayNames(self):
     return self.stepper.extraIntegrationArrayNames
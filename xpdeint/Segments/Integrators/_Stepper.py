@@ -25,7 +25,25 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 from xpdeint.ScriptElement import ScriptElement
 from xpdeint.Utilities import lazy_property
 
+import re
+
 class _Stepper (ScriptElement):
+  # Steppers that describe their stage updates with `stageUpdate` can have those updates
+  # fused into the delta a sweep
+  supportsFusedStages = False
+  
+  # Matches the arrays used in stage update templates, e.g. '_akfield_${vector.id}[$index]'.
+  # The main integration array '_${vector.id}' is matched with an empty name.
+  _stageArrayRegex = re.compile(r'_(\w*?)_?\$\{vector\.id\}\[\$index\]')
+  
+  def __init__(self, *args, **KWs):
+    ScriptElement.__init__(self, *args, **KWs)
+    
+    # The delta a stages of a single step, and the stage updates that follow them.
+    # Each stage update is a (deltaAArrayName, [templateString, ...]) pair
+    self.deltaAStages = set()
+    self.stageUpdates = {}
+  
   @lazy_property
   def integrationVectors(self):
     return self.parent.integrationVectors
@@ -57,3 +75,112 @@ class _Stepper (ScriptElement):
   def updateDependenciesForNextStep(self, *args, **KWs):
     return self.integrator.updateDependenciesForNextStep(*args, **KWs)
   
+  
+  @property
+  def coefficientNamespace(self):
+    """
+    The name of the namespace holding the stepper's coefficient arrays when the stages
+    are fused, or `None` if the stepper doesn't have coefficient arrays.
+    """
+    if not self.hasattr('coefficientDeclarations'):
+      return None
+    return '_%s_coefficients' % self.integrator.name
+  
+  def callDeltaA(self, stage, arguments, parentFunction):
+    """
+    Return the code to evaluate the delta a operators for `stage` of the step. When the
+    stages are fused, the delta a sweep also performs the stage update for `stage`.
+    """
+    self.deltaAStages.add(stage)
+    result = self.callFunction('deltaA', arguments, parentFunction = parentFunction)
+    if self.integrator.fusedStages:
+      result = '_%s_fused_stage = %i;\n' % (self.integrator.name, stage) + result
+    return result
+  
+  def stageUpdate(self, stage, deltaAArrayName, templateString):
+    """
+    Return the code for the update of the integration arrays that follows the delta a
+    evaluation of `stage`, which was done in the `deltaAArrayName` arrays. The update is
+    described by a template string as for `loopOverVectorsWithInnerContentTemplate`.
+    
+    When the stages are fused, the update is instead performed point-by-point in the
+    delta a sweep (see `fusedStageUpdatesForVectors`).
+    """
+    if not stage in self.stageUpdates:
+      self.stageUpdates[stage] = (deltaAArrayName, [])
+    if not templateString in self.stageUpdates[stage][1]:
+      self.stageUpdates[stage][1].append(templateString)
+    
+    if self.integrator.fusedStages:
+      return '// The stage %i update is performed in the delta a sweep\n' % stage
+    return self.loopOverVectorsWithInnerContentTemplate(self.integrationVectors, templateString, basis = self.homeBasis)
+  
+  def fusedStageUpdatesForVectors(self, vectors):
+    """
+    Return the code that performs the stage updates of `vectors` at the current point of
+    a delta a sweep. The stage is chosen at run time by the `_fused_stage` variable of the
+    integrator, which is set by `callDeltaA`.
+    """
+    # The stage updates are collected while the step is written out, which happens
+    # before the operators are written out.
+    assert self.stageUpdates
+    
+    integratorName = self.integrator.name
+    vectors = sorted(vectors, key = lambda v: v.id)
+    arrayNamesUsed = set()
+    for deltaAArrayName, templateStrings in self.stageUpdates.itervalues():
+      for templateString in templateStrings:
+        arrayNamesUsed.update(name for name in self._stageArrayRegex.findall(templateString) if name)
+    
+    result = []
+    if self.coefficientNamespace:
+      result.append('using namespace %s;' % self.coefficientNamespace)
+    for vector in vectors:
+      for arrayName in sorted(arrayNamesUsed):
+        result.append('%(type)s* const _%(arrayName)s_%(id)s = _%(integratorName)s_%(arrayName)s_%(id)s;'
+                      % dict(type = vector.type, arrayName = arrayName, id = vector.id, integratorName = integratorName))
+    result.append('switch (_%s_fused_stage) {' % integratorName)
+    for stage in sorted(self.stageUpdates):
+      result.append('  case %i:' % stage)
+      for templateString in self.stageUpdates[stage][1]:
+        for vector in vectors:
+          for componentIndex in range(len(vector.components)):
+            templateVariables = {'vector': vector, 'index': '_%s_index_pointer + %i' % (vector.id, componentIndex)}
+            code = str(self.templateObjectFromStringWithTemplateVariables(templateString, templateVariables))
+            result.extend('    ' + line for line in code.splitlines() if line.strip() and not line.strip().startswith('//'))
+      result.append('    break;')
+    result.append('}')
+    return '{\n' + '\n'.join('  ' + line for line in result) + '\n}\n'
+  
+  def stageSweepStreams(self, fused):
+    """
+    Return the number of times the integration vectors are read from or written to memory
+    by the delta a sweeps and the stage updates of a single step. An array that is used more
+    than once in the same sweep is only counted once.
+    """
+    streams = 0
+    for stage in self.deltaAStages:
+      # The delta a sweep reads and writes its array
+      deltaAArrayName, templateStrings = self.stageUpdates.get(stage, (None, []))
+      if fused:
+        arraysRead = set([deltaAArrayName])
+        arraysWritten = set([deltaAArrayName])
+      else:
+        streams += 2
+        arraysRead = set()
+        arraysWritten = set()
+      for templateString in templateStrings:
+        for statement in templateString.split(';'):
+          statement = '\n'.join(line for line in statement.splitlines() if not line.strip().startswith('//'))
+          if not '=' in statement:
+            continue
+          lhs, rhs = statement.split('=', 1)
+          arrayNamesRead = self._stageArrayRegex.findall(rhs)
+          if lhs.rstrip().endswith('+') or lhs.rstrip().endswith('-'):
+            arrayNamesRead.extend(self._stageArrayRegex.findall(lhs))
+          for arrayName in arrayNamesRead:
+            if not arrayName in arraysRead and not arrayName in arraysWritten:
+              arraysRead.add(arrayName)
+          arraysWritten.update(self._stageArrayRegex.findall(lhs))
+      streams += len(arraysRead) + len(arraysWritten)
+    return streams
@@ -8,6 +8,7 @@ import RK4Stepper
 import RK9Stepper
 import RK45Stepper
 import RK89Stepper
+import RK43LSStepper
 import SIStepper
 import SICStepper
 import MMStepper
@@ -34,6 +34,8 @@ class _DistributedMPIDriver (SimulationDriver, MPI):
     MPI.__init__(self, *args, **KWs)
     
     self._distributedTransform = None
+    self.parallelOutput = False
+    self.transposeChunks = 1
   
   def _getDistributedTransform(self):
     return self._distributedTransform
@@ -45,9 +47,31 @@ class _DistributedMPIDriver (SimulationDriver, MPI):
   distributedTransform = property(_getDistributedTransform, _setDistributedTransform)
   del _getDistributedTransform, _setDistributedTransform
   
+  @property
+  def uselib(self):
+    # Parallel output needs an HDF5 library with MPI-IO support
+    return ['hdf5_parallel'] if self.parallelOutput else []
+  
+  @property
+  def usesThreads(self):
+    """
+    Return whether the simulation uses threads on each rank, either for OpenMP loops
+    or for threaded FFTW transforms, and so needs thread support from MPI.
+    """
+    return 'OpenMP' in self.getVar('features') or bool(getattr(self._distributedTransform, 'threadCount', None))
+  
   def isFieldDistributed(self, field):
     return self._distributedTransform.isFieldDistributed(field)
   
+  def usesParallelOutput(self, outputFormat, field):
+    """
+    Return whether every rank writes its own part of `field` directly to the output file
+    with MPI-IO instead of sending it to rank 0. This is only possible for the HDF5 output
+    format, and only for fields that contain all of the distributed dimensions.
+    """
+    return self.parallelOutput and outputFormat.name == 'hdf5' \
+           and all([field.hasDimensionName(dimName) for dimName in self.distributedDimensionNames])
+  
   def shadowedVariablesForField(self, field):
     if not self.isFieldDistributed(field):
       return []
@@ -81,6 +105,11 @@ class _DistributedMPIDriver (SimulationDriver, MPI):
     for outputFormat in outputFormats:
       if not outputFormat.mpiSafe:
         raise ParserException(outputFeature.xmlElement, "The '%s' output format cannot be used with the 'distributed-mpi' driver." % outputFormat.name)
+    
+    if self.parallelOutput and not outputFeature.outputFormat.name == 'hdf5':
+      raise ParserException(self.xmlElement, "Parallel output with the 'distributed-mpi' driver requires the 'hdf5' output format.")
+    if self.parallelOutput and outputFeature.outputFormat.compression:
+      raise ParserException(outputFeature.xmlElement, "Compressed output cannot be written in parallel with the 'distributed-mpi' driver.")
   
   def canonicalBasisForBasis(self, basis, **KWs):
     basis = self.basisWithTransverseDimensionsMovedAfterMPIDimensions(basis)
@@ -27,6 +27,11 @@ from xpdeint.SimulationDrivers.SimulationDriver import SimulationDriver
 class _MultiPathDriver (SimulationDriver):
   logLevelsBeingLogged = "_PATH_LOG_LEVEL|_SIMULATION_LOG_LEVEL|_WARNING_LOG_LEVEL|_ERROR_LOG_LEVEL|_NO_ERROR_TERMINATE_LOG_LEVEL"
   
+  # How the moment group results are accumulated across paths. Either 'sum', which keeps
+  # a running sum and sum of squares, or 'welford', which keeps a running mean and sum of
+  # squared deviations from the mean.
+  accumulator = 'sum'
+  
   def preflight(self):
     super(_MultiPathDriver, self).preflight()
     
@@ -41,3 +46,25 @@ class _MultiPathDriver (SimulationDriver):
     """
     dict['returnValue'] = True
   
+  @property
+  def usesWelfordAccumulator(self):
+    return self.accumulator == 'welford'
+  
+  def pathCountIndex(self):
+    # With error checking the full- and half-step passes each keep their own path count
+    return '_half_step' if 'ErrorCheck' in self.getVar('features') else '0'
+  
+  def welfordAccumulators(self, momentGroup):
+    """
+    Returns a list of ``(meanArrayName, m2ArrayName, pathCountName)`` tuples describing the
+    running means maintained for `momentGroup` when using the Welford accumulator.
+    `m2ArrayName` is the array holding the sum of squared deviations from that mean, or `None`
+    if the mean has no such array.
+    """
+    fieldName = momentGroup.outputField.name
+    processedArrayName = '_' + momentGroup.processedVector.id
+    if 'ErrorCheck' in self.getVar('features'):
+      return [(processedArrayName, None, '_%s_path_count[0]' % fieldName),
+              ('_%s_halfstep' % fieldName, '_%s_sd' % fieldName, '_%s_path_count[1]' % fieldName)]
+    return [(processedArrayName, '_%s_sd' % fieldName, '_%s_path_count[0]' % fieldName)]
+  
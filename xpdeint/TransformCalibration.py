@@ -0,0 +1,109 @@
+#!/usr/bin/env python
+# encoding: utf-8
+"""
+TransformCalibration.py
+
+Created by the xmds team on 2026-10-18.
+
+Copyright (c) 2026, the xmds team
+
+This program is free software: you can redistribute it and/or modify
+it under the terms of the GNU General Public License as published by
+the Free Software Foundation, either version 2 of the License, or
+(at your option) any later version.
+
+This program is distributed in the hope that it will be useful,
+but WITHOUT ANY WARRANTY; without even the implied warranty of
+MERCHANTABILITY or FITNESS FOR A PARTICULAR PURPOSE.  See the
+GNU General Public License for more details.
+
+You should have received a copy of the GNU General Public License
+along with this program.  If not, see <http://www.gnu.org/licenses/>.
+
+"""
+
+import os
+import platform
+import shutil
+import subprocess
+import tempfile
+
+from pkg_resources import resource_filename
+
+from xpdeint import Configuration
+
+# The heuristic per-point costs used by the transform path search when the transforms
+# have not been calibrated on this machine.  All costs are relative to an out-of-place copy.
+# See `transform_calibration.cc` for the units of each cost.
+defaultTransformCosts = {
+  'copy': 1,
+  'inPlaceMultiply': 1,
+  'outOfPlaceMultiply': 2,
+  'complexFFT': 1,
+  'realFFT': 1,
+  'realMatrixMultiply': 1,
+  'complexMatrixMultiply': 4,
+}
+
+def transformCostsForThisMachine(dataCache):
+  """
+  Return the calibrated transform costs stored in `dataCache` for this machine,
+  or the heuristic costs if the transforms have not been calibrated.
+
+  The calibration is keyed by host name so that a shared ~/.xmds directory
+  doesn't apply one machine's measurements to another.
+  """
+  return dataCache.get('transformCosts', {}).get(platform.node(), defaultTransformCosts)
+
+def run_calibration(dataCache, verbose = False):
+  """
+  Compile and run the transform benchmark and store the measured costs
+  in `dataCache`. Returns zero on success.
+  """
+  uselib = ['fftw3', 'optimise']
+  if 'cblas' in Configuration.available_uselib():
+    uselib.append('cblas')
+
+  cwd = os.getcwd()
+  calibrationPath = tempfile.mkdtemp(prefix = 'xmds_calibration')
+  try:
+    os.chdir(calibrationPath)
+    shutil.copyfile(resource_filename(__name__, 'support/transform_calibration.cc'), 'transform_calibration.cc')
+
+    print "Compiling transform benchmark..."
+    result = Configuration.run_build(
+      'transform_calibration.cc',
+      'transform_calibration',
+      buildKWs = {'includes': [], 'uselib': uselib},
+      verbose = verbose
+    )
+    if result != 0:
+      print "\n\nFATAL ERROR: Failed to compile the transform benchmark."
+      return result
+
+    print "Measuring transform costs (this will take a minute)..."
+    benchmark = subprocess.Popen(['./transform_calibration'], stdout = subprocess.PIPE)
+    output = benchmark.communicate()[0]
+    if benchmark.returncode != 0:
+      print "\n\nFATAL ERROR: The transform benchmark failed."
+      return -1
+  finally:
+    os.chdir(cwd)
+    shutil.rmtree(calibrationPath, ignore_errors = True)
+
+  timings = dict((name, float(value)) for name, value in [line.split() for line in output.splitlines() if line.strip()])
+
+  # Operations that couldn't be benchmarked (e.g. matrix multiplies without CBLAS)
+  # keep their heuristic costs, scaled relative to the heuristic copy cost.
+  costs = dict(defaultTransformCosts)
+  costs.update((name, timing / timings['copy']) for name, timing in timings.items())
+
+  dataCache.setdefault('transformCosts', {})[platform.node()] = costs
+
+  print "Transform costs relative to an out-of-place copy:"
+  for name in sorted(costs):
+    measured = '' if name in timings else ' (not measured)'
+    print "  %-22s %8.3f%s" % (name, costs[name], measured)
+  print "... done"
+
+  return 0
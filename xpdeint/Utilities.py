@@ -24,6 +24,7 @@ import re
 import sys
 
 from heapq import heapify, heappush, heappop
+from collections import OrderedDict
 import operator
 
 class lazy_property(object):
@@ -50,6 +51,45 @@ class lazy_property(object):
     return result
   
 
+class BoundedCache(object):
+  """
+  A mapping that holds at most `maxEntries` items. When an item is added to a full cache,
+  the least recently used item is discarded. This is used for the values kept in the
+  xmds2 data cache between runs so that the data cache doesn't grow without bound.
+  """
+  
+  def __init__(self, maxEntries):
+    self.maxEntries = maxEntries
+    self._items = OrderedDict()
+  
+  @classmethod
+  def inDataCache(cls, dataCache, name, maxEntries):
+    """Return the bounded cache called `name` in `dataCache`, creating it if necessary."""
+    cache = dataCache.get(name)
+    if not isinstance(cache, cls):
+      cache = dataCache[name] = cls(maxEntries)
+    cache.maxEntries = maxEntries
+    return cache
+  
+  def __contains__(self, key):
+    return key in self._items
+  
+  def __len__(self):
+    return len(self._items)
+  
+  def __getitem__(self, key):
+    # Move the item to the end, which holds the most recently used items
+    value = self._items.pop(key)
+    self._items[key] = value
+    return value
+  
+  def __setitem__(self, key, value):
+    self._items.pop(key, None)
+    self._items[key] = value
+    while len(self._items) > self.maxEntries:
+      self._items.popitem(last = False)
+  
+
 def valueForKeyPath(base, keyPath):
   """
   Return the value for a dotted-name lookup of `keyPath` anchored at `base`.
@@ -93,3 +93,6 @@ class _NoiseVector (VectorElement):
   
   def initialiseLocalSeeds(self):
     return self.randomVariable.generator.initialiseLocalSeeds()
+  
+  def beginPath(self, pathIndex):
+    return self.randomVariable.generator.beginPath(pathIndex)
@@ -57,6 +57,7 @@ class _VectorElement (ScriptElement):
     self.aliases = set()
     self.basesNeeded = set()
     self.initialBasis = None
+    self.transformBatch = None
     
     if localKWs.get('initialBasis') is not None:
       self.initialBasis = self.field.basisForBasis(localKWs['initialBasis'])
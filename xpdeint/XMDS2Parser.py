@@ -44,14 +44,17 @@ from xpdeint.Vectors.VectorElement import VectorElement as VectorElementTemplate
 from xpdeint.Vectors.ComputedVector import ComputedVector as ComputedVectorTemplate
 from xpdeint.Vectors.NoiseVector import NoiseVector as NoiseVectorTemplate
 from xpdeint.Stochastic.RandomVariables.GaussianBoxMuellerRandomVariable import GaussianBoxMuellerRandomVariable
+from xpdeint.Stochastic.RandomVariables.GaussianBlockBoxMuellerRandomVariable import GaussianBlockBoxMuellerRandomVariable
 from xpdeint.Stochastic.RandomVariables.GaussianMKLRandomVariable import GaussianMKLRandomVariable
 from xpdeint.Stochastic.RandomVariables.GaussianSolirteRandomVariable import GaussianSolirteRandomVariable
+from xpdeint.Stochastic.RandomVariables.GaussianPhiloxRandomVariable import GaussianPhiloxRandomVariable
 from xpdeint.Stochastic.RandomVariables.UniformRandomVariable import UniformRandomVariable
 from xpdeint.Stochastic.RandomVariables.PoissonianRandomVariable import PoissonianRandomVariable
 from xpdeint.Stochastic.Generators.POSIXGenerator import POSIXGenerator
 from xpdeint.Stochastic.Generators.MKLGenerator import MKLGenerator
 from xpdeint.Stochastic.Generators.DSFMTGenerator import DSFMTGenerator
 from xpdeint.Stochastic.Generators.SolirteGenerator import SolirteGenerator
+from xpdeint.Stochastic.Generators.PhiloxGenerator import PhiloxGenerator
 from xpdeint.Vectors.VectorInitialisation import VectorInitialisation as VectorInitialisationZeroTemplate
 from xpdeint.Vectors.VectorInitialisationFromCDATA import VectorInitialisationFromCDATA as VectorInitialisationFromCDATATemplate
 from xpdeint.Vectors.VectorInitialisationFromXSIL import VectorInitialisationFromXSIL as VectorInitialisationFromXSILTemplate
@@ -63,6 +66,7 @@ from xpdeint.SimulationDrivers.SimulationDriver import SimulationDriver as Simul
 from xpdeint.SimulationDrivers.MultiPathDriver import MultiPathDriver as MultiPathDriverTemplate
 from xpdeint.SimulationDrivers.MPIMultiPathDriver import MPIMultiPathDriver as MPIMultiPathDriverTemplate
 from xpdeint.SimulationDrivers.AdaptiveMPIMultiPathDriver import AdaptiveMPIMultiPathDriver as AdaptiveMPIMultiPathDriverTemplate
+from xpdeint.SimulationDrivers.SharedMemoryMultiPathDriver import SharedMemoryMultiPathDriver as SharedMemoryMultiPathDriverTemplate
 from xpdeint.SimulationDrivers.DistributedMPIDriver import DistributedMPIDriver as DistributedMPIDriverTemplate
 
 from xpdeint.Segments import Integrators
@@ -203,6 +207,8 @@ class XMDS2Parser(ScriptParser):
             driverClass = MPIMultiPathDriverTemplate
           elif driverName == 'adaptive-mpi-multi-path':
             driverClass = AdaptiveMPIMultiPathDriverTemplate
+          elif driverName == 'shared-memory-multi-path':
+            driverClass = SharedMemoryMultiPathDriverTemplate
           else:
             raise UnknownDriverException()
           
@@ -233,7 +239,8 @@ class XMDS2Parser(ScriptParser):
           raise UnknownDriverException()
       except UnknownDriverException, err:
         raise ParserException(driverElement, "Unknown driver type '%(driverName)s'. "
-                                             "The options are 'none' (default), 'multi-path', 'mpi-multi-path', 'adaptive-mpi-multi-path' or 'distributed-mpi'." % locals())
+                                             "The options are 'none' (default), 'multi-path', 'mpi-multi-path', 'adaptive-mpi-multi-path', "
+                                             "'shared-memory-multi-path' or 'distributed-mpi'." % locals())
       
       if driverClass == MultiPathDriverTemplate:
         kindString = None
@@ -243,10 +250,52 @@ class XMDS2Parser(ScriptParser):
           pass
         elif kindString == 'mpi':
           driverClass = MPIMultiPathDriverTemplate
+        elif kindString == 'shared-memory':
+          driverClass = SharedMemoryMultiPathDriverTemplate
         else:
           raise ParserException(driverElement,
                                 "Unknown multi-path kind '%(kindString)s'. "
-                                "The options are 'single' (default), or 'mpi'." % locals())
+                                "The options are 'single' (default), 'mpi' or 'shared-memory'." % locals())
+      
+      if driverElement.hasAttribute('accumulator'):
+        if not 'multi-path' in driverName:
+          raise ParserException(driverElement, "The 'accumulator' attribute is only valid for multi-path drivers.")
+        accumulatorString = driverElement.getAttribute('accumulator').strip().lower()
+        if not accumulatorString in ('sum', 'welford'):
+          raise ParserException(driverElement,
+                                "Unknown accumulator '%(accumulatorString)s'. "
+                                "The options are 'sum' (default) or 'welford'." % locals())
+        driverAttributeDictionary['accumulator'] = accumulatorString
+      
+      if driverClass == SharedMemoryMultiPathDriverTemplate and driverElement.hasAttribute('workers'):
+        workerCountString = driverElement.getAttribute('workers')
+        try:
+          workerCount = RegularExpressionStrings.integerInString(workerCountString)
+        except ValueError, err:
+          raise ParserException(driverElement, "Could not understand worker count '%(workerCountString)s' as an integer." % locals())
+        if workerCount <= 0:
+          raise ParserException(driverElement, "The number of workers must be greater than 0.")
+        driverAttributeDictionary['workerCount'] = workerCount
+      
+      if driverElement.hasAttribute('parallel_output'):
+        if not driverClass == DistributedMPIDriverTemplate:
+          raise ParserException(driverElement, "The 'parallel_output' attribute is only valid for the 'distributed-mpi' driver.")
+        parallelOutputString = driverElement.getAttribute('parallel_output').strip().lower()
+        if not parallelOutputString in ('yes', 'no'):
+          raise ParserException(driverElement, "Attribute 'parallel_output' should be either 'yes' or 'no'.")
+        driverAttributeDictionary['parallelOutput'] = (parallelOutputString == 'yes')
+      
+      if driverElement.hasAttribute('transpose_chunks'):
+        if not driverClass == DistributedMPIDriverTemplate:
+          raise ParserException(driverElement, "The 'transpose_chunks' attribute is only valid for the 'distributed-mpi' driver.")
+        transposeChunksString = driverElement.getAttribute('transpose_chunks')
+        try:
+          transposeChunks = RegularExpressionStrings.integerInString(transposeChunksString)
+        except ValueError, err:
+          raise ParserException(driverElement, "Could not understand transpose chunk count '%(transposeChunksString)s' as an integer." % locals())
+        if transposeChunks <= 0:
+          raise ParserException(driverElement, "The number of transpose chunks must be greater than 0.")
+        driverAttributeDictionary['transposeChunks'] = transposeChunks
     
     simulationDriver = driverClass(parent = self.simulation, xmlElement = driverElement,
                                    **self.argumentsToTemplateConstructors)
@@ -1172,9 +1221,19 @@ Use feature <validation kind="run-time"/> to allow for arbitrary code.""" % loca
         'dsfmt': (GaussianBoxMuellerRandomVariable, DSFMTGenerator),
         'posix': (GaussianBoxMuellerRandomVariable, POSIXGenerator),
         'solirte': (GaussianSolirteRandomVariable, SolirteGenerator),
+        'philox': (GaussianPhiloxRandomVariable, PhiloxGenerator),
       }.get(vectorMethod,(None,None))
       if not generatorClass:
-        raise ParserException(noiseVectorElement, "Method '%(vectorMethod)s' for Gaussian noises is unknown.  Legal possibilities include 'mkl', 'dsfmt', 'posix' and 'solirte'." % locals())
+        raise ParserException(noiseVectorElement, "Method '%(vectorMethod)s' for Gaussian noises is unknown.  Legal possibilities include 'mkl', 'dsfmt', 'posix', 'solirte' and 'philox'." % locals())
+      
+      if noiseVectorElement.hasAttribute('sampler'):
+        samplerName = noiseVectorElement.getAttribute('sampler').strip().lower()
+        if not samplerName in ('polar', 'block'):
+          raise ParserException(noiseVectorElement, "Unknown sampler '%(samplerName)s'. The options are 'polar' (default) or 'block'." % locals())
+        if not randomVariableClass is GaussianBoxMuellerRandomVariable:
+          raise ParserException(noiseVectorElement, "The 'sampler' attribute can only be used with the 'posix' and 'dsfmt' methods.")
+        if samplerName == 'block':
+          randomVariableClass = GaussianBlockBoxMuellerRandomVariable
     
     elif vectorKind == 'uniform':
       static = True
@@ -1184,6 +1243,7 @@ Use feature <validation kind="run-time"/> to allow for arbitrary code.""" % loca
         'dsfmt': DSFMTGenerator,
         'posix': POSIXGenerator,
         'solirte': SolirteGenerator,
+        'philox': PhiloxGenerator,
       }.get(vectorMethod)
       if not generatorClass:
         raise ParserException(noiseVectorElement, "Method '%(vectorMethod)s' for uniform noises is unknown." % locals())
@@ -1420,6 +1480,8 @@ Use feature <validation kind="run-time"/> to allow for arbitrary code.""" % loca
       'RK89':  (Integrators.FixedStep.FixedStep,                   Integrators.RK89Stepper.RK89Stepper),
       'ARK45': (Integrators.AdaptiveStep.AdaptiveStep,             Integrators.RK45Stepper.RK45Stepper),
       'ARK89': (Integrators.AdaptiveStep.AdaptiveStep,             Integrators.RK89Stepper.RK89Stepper),
+      'RK43LS': (Integrators.FixedStep.FixedStep,                  Integrators.RK43LSStepper.RK43LSStepper),
+      'ARK43LS': (Integrators.AdaptiveStep.AdaptiveStep,           Integrators.RK43LSStepper.RK43LSStepper),
       'SIC':   (Integrators.FixedStepWithCross.FixedStepWithCross, Integrators.SICStepper.SICStepper),
       'MM':    (Integrators.FixedStep.FixedStep, Integrators.MMStepper.MMStepper),
       'REMM':  (Integrators.RichardsonFixedStep.RichardsonFixedStep, Integrators.MMStepper.MMStepper),
@@ -1460,9 +1522,34 @@ Use feature <validation kind="run-time"/> to allow for arbitrary code.""" % loca
         if algorithmSpecificOptionsDict['iterations'] < 1:
           raise ParserException(integrateElement, "Iterations element must be 1 or greater (default 3).")
     
-    integratorTemplate = integratorTemplateClass(stepperClass = stepperTemplateClass, **self.argumentsToTemplateConstructors)
+    integratorTemplate = integratorTemplateClass(stepperClass = stepperTemplateClass, xmlElement = integrateElement,
+                                                 **self.argumentsToTemplateConstructors)
     self.applyAttributeDictionaryToObject(algorithmSpecificOptionsDict, stepperTemplateClass)
     
+    if integrateElement.hasAttribute('iteration_tolerance'):
+      if not algorithmString == 'SI':
+        raise ParserException(integrateElement, "The 'iteration_tolerance' attribute is only applicable to the SI algorithm.")
+      iterationToleranceString = integrateElement.getAttribute('iteration_tolerance').strip()
+      try:
+        iterationTolerance = float(iterationToleranceString)
+      except ValueError, err:
+        raise ParserException(integrateElement, "Could not understand iteration tolerance '%(iterationToleranceString)s' "
+                                                "as a number." % locals())
+      if not iterationTolerance > 0.0:
+        raise ParserException(integrateElement, "The iteration tolerance must be positive.")
+      stepper = integratorTemplate.stepper
+      stepper.iterationTolerance = iterationTolerance
+      # The iterations keep the last increment to check that it has converged
+      stepper.extraIntegrationArrayNames = stepper.extraIntegrationArrayNames + ['lastIncrement']
+      if not integrateElement.hasAttribute('iterations'):
+        stepper.iterations = 10
+    
+    if integrateElement.hasAttribute('fuse_stages'):
+      fuseStagesString = integrateElement.getAttribute('fuse_stages').strip().lower()
+      if not fuseStagesString in ('yes', 'no'):
+        raise ParserException(integrateElement, "Attribute 'fuse_stages' should be either 'yes' or 'no'.")
+      integratorTemplate.fuseStages = (fuseStagesString == 'yes')
+    
     if integrateElement.hasAttribute('home_space'):
       attributeValue = integrateElement.getAttribute('home_space').strip().lower()
       if attributeValue == 'k':
@@ -1510,7 +1597,20 @@ Use feature <validation kind="run-time"/> to allow for arbitrary code.""" % loca
           raise ParserException(integrateElement, "Could not understand cutoff '%(cutoffString)s' "
                                                   "as a number." % locals())
         integratorTemplate.cutoff = cutoff
-        
+
+      if integrateElement.hasAttribute('error_norm'):
+        errorNorm = integrateElement.getAttribute('error_norm').strip().lower()
+        if not errorNorm in ['max', 'fused-max', 'rms']:
+          raise ParserException(integrateElement, "Unknown error norm '%(errorNorm)s'. "
+                                                  "The options are 'max' (default), 'fused-max' or 'rms'." % locals())
+        integratorTemplate.errorNorm = errorNorm
+
+      self.parseStepControllerAttributes(integrateElement, integratorTemplate)
+    else:
+      for attributeName in ['error_norm', 'step_controller', 'controller_gains', 'safety_factor', 'step_factor_limits']:
+        if integrateElement.hasAttribute(attributeName):
+          raise ParserException(integrateElement, "The '%(attributeName)s' attribute is only applicable to adaptive integrators." % locals())
+
     if integrateElement.hasAttribute('extrapolations'):
       if isinstance(integratorTemplate, Integrators.RichardsonFixedStep.RichardsonFixedStep):
         extrapolations = RegularExpressionStrings.integerInString(integrateElement.getAttribute('extrapolations'))
@@ -1590,6 +1690,58 @@ Use feature <validation kind="run-time"/> to allow for arbitrary code.""" % loca
     
     return integratorTemplate
   
+  def parseStepControllerAttributes(self, integrateElement, integratorTemplate):
+    # The gains of each controller are the exponents of the current and previous (normalised) errors
+    # in units of one over the integration order. The defaults are those of Kennedy & Carpenter (2003).
+    defaultGainsMap = {
+      'standard': [],
+      'integral': [1.0],
+      'pi':       [0.7, 0.4],
+      'pid':      [0.49, 0.34, 0.10],
+    }
+    
+    if integrateElement.hasAttribute('step_controller'):
+      stepController = integrateElement.getAttribute('step_controller').strip().lower()
+      if not stepController in defaultGainsMap:
+        raise ParserException(integrateElement, "Unknown step controller '%(stepController)s'. "
+                                                "The options are 'standard' (default), 'integral', 'pi' or 'pid'." % locals())
+      integratorTemplate.stepController = stepController
+    stepController = integratorTemplate.stepController
+    
+    def realsInAttribute(attributeName):
+      attributeString = integrateElement.getAttribute(attributeName).strip()
+      try:
+        return [float(valueString) for valueString in attributeString.split()]
+      except ValueError, err:
+        raise ParserException(integrateElement, "Could not understand '%(attributeString)s' in the '%(attributeName)s' attribute "
+                                                "as a list of numbers." % locals())
+    
+    controllerGains = defaultGainsMap[stepController]
+    if integrateElement.hasAttribute('controller_gains'):
+      if stepController == 'standard':
+        raise ParserException(integrateElement, "The 'controller_gains' attribute requires the 'step_controller' attribute "
+                                                "to be one of 'integral', 'pi' or 'pid'.")
+      controllerGains = realsInAttribute('controller_gains')
+      if not len(controllerGains) == len(defaultGainsMap[stepController]):
+        raise ParserException(integrateElement, "The '%s' step controller needs %i gains in the 'controller_gains' attribute." % \
+                                                (stepController, len(defaultGainsMap[stepController])))
+      if not controllerGains[0] > 0.0:
+        raise ParserException(integrateElement, "The first controller gain must be positive.")
+    integratorTemplate.controllerGains = controllerGains
+    
+    if integrateElement.hasAttribute('safety_factor'):
+      safetyFactors = realsInAttribute('safety_factor')
+      if not len(safetyFactors) == 1 or not 0.0 < safetyFactors[0] <= 1.0:
+        raise ParserException(integrateElement, "The safety factor must be a single number in the range (0.0, 1.0].")
+      integratorTemplate.safetyFactor = safetyFactors[0]
+    
+    if integrateElement.hasAttribute('step_factor_limits'):
+      stepFactorLimits = realsInAttribute('step_factor_limits')
+      if not len(stepFactorLimits) == 2 or not 0.0 < stepFactorLimits[0] < 1.0 < stepFactorLimits[1]:
+        raise ParserException(integrateElement, "The 'step_factor_limits' attribute must be two numbers, the smallest and largest factor "
+                                                "by which the step can change, with 0 < smallest < 1 < largest.")
+      integratorTemplate.minimumStepFactor, integratorTemplate.maximumStepFactor = stepFactorLimits
+  
   def parseFiltersElements(self, integrateElement, integratorTemplate):
     filtersElements = integrateElement.getChildElementsByTagName('filters', optional=True)
     
@@ -2107,6 +2259,71 @@ Use feature <validation kind="run-time"/> to allow for arbitrary code.""" % loca
     operatorTemplate.crossPropagationIntegratorDeltaAOperator = operatorContainer.deltaAOperator
   
   
+  def parseHDF5LayoutAttributes(self, outputElement, outputFormat, geometryDimRepNameMap):
+    layoutAttributeNames = ['chunk_shape', 'chunk_cache', 'compression', 'compression_level', 'shuffle']
+    if not outputFormat.name == 'hdf5':
+      for attributeName in layoutAttributeNames:
+        if outputElement.hasAttribute(attributeName):
+          raise ParserException(outputElement, "The '%(attributeName)s' attribute is only valid for the 'hdf5' output format." % locals())
+      return
+    
+    if outputElement.hasAttribute('chunk_shape'):
+      propagationDimensionName = self.globalNameSpace['globalPropagationDimension']
+      for component in outputElement.getAttribute('chunk_shape').split():
+        # Each component of the chunk shape is of the form 'dimRepName(numberOfPoints)'
+        # where dimRepName is the propagation dimension or the name of a dimension in any basis.
+        match = re.match(r'(\w+)\((\d+)\)$', component)
+        if not match:
+          raise ParserException(outputElement, "Unable to interpret '%(component)s' in the 'chunk_shape' attribute. "
+                                               "Each dimension must be given as 'name(points)'." % locals())
+        dimRepName, chunkLattice = match.group(1), int(match.group(2))
+        if dimRepName == propagationDimensionName:
+          dimName = propagationDimensionName
+        elif dimRepName in geometryDimRepNameMap:
+          dimName = geometryDimRepNameMap[dimRepName].name
+        else:
+          raise ParserException(outputElement, "'%(dimRepName)s' in the 'chunk_shape' attribute is not recognised as a dimension." % locals())
+        if not chunkLattice > 0:
+          raise ParserException(outputElement, "The chunk size for dimension '%(dimRepName)s' must be greater than zero." % locals())
+        outputFormat.chunkShape[dimName] = chunkLattice
+    
+    if outputElement.hasAttribute('chunk_cache'):
+      sizeString = outputElement.getAttribute('chunk_cache').strip().lower()
+      match = re.match(r'(\d+)(b|kb|mb|gb|tb)$', sizeString)
+      if not match:
+        raise ParserException(
+          outputElement,
+          "The 'chunk_cache' attribute must be an integer followed by one of the suffixes "
+          "'B' (bytes), 'kB' (kilobytes), 'MB' (megabytes), 'GB' (gigabytes) or 'TB' (terabytes)."
+        )
+      chunkCacheSize = int(match.group(1))
+      chunkCacheSize *= 1024 ** {'b': 0, 'kb': 1, 'mb': 2, 'gb': 3, 'tb': 4}[match.group(2)]
+      outputFormat.chunkCacheSize = chunkCacheSize
+    
+    if outputElement.hasAttribute('compression'):
+      compressionString = outputElement.getAttribute('compression').strip().lower()
+      if not compressionString in ('none', 'deflate', 'szip'):
+        raise ParserException(outputElement, "Unknown compression '%(compressionString)s'. "
+                                             "The options are 'none' (default), 'deflate' or 'szip'." % locals())
+      if not compressionString == 'none':
+        outputFormat.compression = compressionString
+    
+    if outputElement.hasAttribute('compression_level'):
+      if not outputFormat.compression == 'deflate':
+        raise ParserException(outputElement, "The 'compression_level' attribute can only be used with 'deflate' compression.")
+      compressionLevelString = outputElement.getAttribute('compression_level').strip()
+      if not compressionLevelString.isdigit() or not 0 <= int(compressionLevelString) <= 9:
+        raise ParserException(outputElement, "The compression level must be an integer between 0 and 9.")
+      outputFormat.compressionLevel = int(compressionLevelString)
+    
+    if outputElement.hasAttribute('shuffle'):
+      shuffleString = outputElement.getAttribute('shuffle').strip().lower()
+      if not shuffleString in ('yes', 'no'):
+        raise ParserException(outputElement, "Attribute 'shuffle' should be either 'yes' or 'no'.")
+      if shuffleString == 'yes' and not outputFormat.compression:
+        raise ParserException(outputElement, "The 'shuffle' filter can only be used with compression.")
+      outputFormat.shuffle = (shuffleString == 'yes')
+  
   def parseOutputElement(self, simulationElement):
     outputElement = simulationElement.getChildElementByTagName('output')
     
@@ -2148,6 +2365,7 @@ Use feature <validation kind="run-time"/> to allow for arbitrary code.""" % loca
         for dimRep in dim.representations:
             geometryDimRepNameMap[dimRep.name] = dim
     
+    self.parseHDF5LayoutAttributes(outputElement, outputFormat, geometryDimRepNameMap)
     
     momentGroupElements = outputElement.getChildElementsByTagNames(['group', 'sampling_group'], optional=True)
     for momentGroupNumber, momentGroupElement in enumerate(momentGroupElements):
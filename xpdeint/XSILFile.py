@@ -23,6 +23,9 @@ along with this program.  If not, see <http://www.gnu.org/licenses/>.
 """
 
 import os
+import shutil
+import tempfile
+import unittest
 from xml.dom import minidom
 import xpdeint.minidom_extras
 
@@ -41,11 +44,38 @@ def require_numpy():
     import numpy
 
 
+class XSILVariable(dict):
+  """
+  A dictionary describing an independent or dependent variable of an XSIL object.
+  
+  When data is loaded lazily, the ``'array'`` entry doesn't exist until it is first
+  accessed, at which point it is created by calling `loader` with this variable.
+  """
+  def __init__(self, *args, **KWs):
+    dict.__init__(self, *args, **KWs)
+    self.loader = None
+  
+  def __missing__(self, key):
+    if key == 'array' and self.loader:
+      self['array'] = self.loader(self)
+      return self['array']
+    raise KeyError(key)
+  
+
 class XSILData(object):
   def __init__(self, independentVariables, dependentVariables):
     self.independentVariables = independentVariables
     self.dependentVariables = dependentVariables
   
+  def close(self):
+    """
+    Forget the arrays that have been loaded lazily, so that the files they use can be closed.
+    They are loaded again if they are accessed later.
+    """
+    for variable in self.independentVariables + self.dependentVariables:
+      if variable.loader:
+        variable.pop('array', None)
+  
 
 class XSILDataASCII(XSILData):
   format = 'ascii'
@@ -57,25 +87,26 @@ class XSILDataASCII(XSILData):
   def parseDataString(self, dataString):
     require_numpy()
     
-    lines = dataString.splitlines()
-    del dataString
     varCount = len(self.independentVariables) + len(self.dependentVariables)
-    indepSize = reduce(int.__mul__, [indVar['length'] for indVar in self.independentVariables])
-    result = numpy.empty(indepSize*varCount)
-    for lineNum, line in enumerate(lines):
-      result[lineNum*varCount:((lineNum+1)*varCount)] = numpy.fromstring(line, numpy.float64, sep=' ')
+    independentGeometry = [ivar['length'] for ivar in self.independentVariables]
+    indepSize = reduce(int.__mul__, independentGeometry, 1)
+    if len(independentGeometry) == 0:
+      independentGeometry.append(1)
+    # Newlines are whitespace, so the whole table can be parsed in one pass straight into its final array
+    result = numpy.fromstring(dataString, numpy.float64, count=indepSize*varCount, sep=' ')
+    del dataString
     assert len(result) == indepSize*varCount
     
-    result = result.reshape(indepSize, varCount)
-    independentGeometry = []
+    # The rows are in lattice order with the last independent variable changing fastest, so
+    # the values of each independent variable are found along the corresponding axis of the table.
+    result = result.reshape(*(independentGeometry + [varCount]))
     
     for varNum, ivar in enumerate(self.independentVariables):
-      independentGeometry.append(ivar['length'])
-      ivar['array'] = numpy.unique(result[:, varNum])
-      assert len(ivar['array']) == ivar['length']
+      index = [0] * len(independentGeometry) + [varNum]
+      index[varNum] = slice(None)
+      ivar['array'] = result[tuple(index)].copy()
     for varNum, dvar in enumerate(self.dependentVariables):
-      a = result[:, varNum + len(self.independentVariables)]
-      dvar['array'] = a.reshape(*independentGeometry)
+      dvar['array'] = result[..., varNum + len(self.independentVariables)]
     
   
 
@@ -84,7 +115,7 @@ class XSILDataBinary(XSILData):
   
   format = 'binary'
   
-  def __init__(self, independentVariables, dependentVariables, uLong, precision, encoding, dataFile, loadData = True):
+  def __init__(self, independentVariables, dependentVariables, uLong, precision, encoding, dataFile, loadData = True, lazy = False):
     XSILData.__init__(self, independentVariables, dependentVariables)
     self.filename = os.path.split(dataFile)[1]
     
@@ -95,30 +126,71 @@ class XSILDataBinary(XSILData):
     self.precision = precision
     self.encoding = encoding
     
-    if loadData: self.parseDataFile(uLong, precision, encoding, dataFile)
+    if loadData and lazy: self.mapDataFile(uLong, precision, encoding, dataFile)
+    elif loadData: self.parseDataFile(uLong, precision, encoding, dataFile)
   
-  def parseDataFile(self, uLong, precision, encoding, dataFile):
+  def dataTypes(self, uLong, precision, encoding):
     assert uLong in ['uint32', 'uint64']
     assert precision in ['single', 'double']
     assert encoding in ['BigEndian', 'LittleEndian']
     
     require_numpy()
     
-    fd = file(dataFile, 'rb')
-    
     byteorder = {'LittleEndian': '<', 'BigEndian': '>'}[encoding]
     unsignedLongTypeString = {'uint32': 'u4', 'uint64': 'u8'}[uLong]
     realTypeString = {'single': 'f4', 'double': 'f8'}[precision]
     
-    ulongDType = numpy.dtype(byteorder + unsignedLongTypeString)
-    floatDType = numpy.dtype(byteorder + realTypeString)
+    return numpy.dtype(byteorder + unsignedLongTypeString), numpy.dtype(byteorder + realTypeString)
+  
+  def mapDataFile(self, uLong, precision, encoding, dataFile):
+    """
+    Find where each variable is stored in `dataFile` without reading the data. Each variable's
+    array is a read-only memory map of its part of `dataFile`, which is created when it is first accessed.
+    """
+    ulongDType, floatDType = self.dataTypes(uLong, precision, encoding)
+    
+    fileSize = os.path.getsize(dataFile)
+    fd = file(dataFile, 'rb')
+    
+    def mapVariable(variable, shape):
+      offset = fd.tell() + ulongDType.itemsize
+      size = numpy.fromfile(fd, dtype=ulongDType, count=1)
+      assert size.size == 1 and size[0] == numpy.prod(shape) and offset + size[0] * floatDType.itemsize <= fileSize, \
+        "Data file %s has incorrect size. Variable '%s' wasn't written completely." % (dataFile, variable['name'])
+      size = int(size[0])
+      fd.seek(size * floatDType.itemsize, os.SEEK_CUR)
+      def loader(variable):
+        if not size:
+          # Empty files can't be memory mapped
+          return numpy.empty(shape, dtype=floatDType)
+        return numpy.memmap(dataFile, dtype=floatDType, mode='r', offset=offset, shape=shape)
+      variable.loader = loader
+    
+    independentGeometry = []
+    
+    for independentVariable in self.independentVariables:
+      independentGeometry.append(independentVariable['length'])
+      mapVariable(independentVariable, (independentVariable['length'],))
+    
+    if len(independentGeometry) == 0:
+      independentGeometry.append(1)
+    
+    for dependentVariable in self.dependentVariables:
+      mapVariable(dependentVariable, tuple(independentGeometry))
+    
+    fd.close()
+  
+  def parseDataFile(self, uLong, precision, encoding, dataFile):
+    ulongDType, floatDType = self.dataTypes(uLong, precision, encoding)
+    
+    fd = file(dataFile, 'rb')
     
     independentGeometry = []
     
     for independentVariable in self.independentVariables:
       size = numpy.fromfile(fd, dtype=ulongDType, count=1)
-      independentGeometry.append(size)
       assert size == independentVariable['length']
+      independentGeometry.append(independentVariable['length'])
       a = numpy.fromfile(fd, dtype=floatDType, count=size)
       independentVariable['array'] = a
     
@@ -138,27 +210,53 @@ class XSILDataHDF5(XSILData):
   
   format = 'hdf5'
   
-  def __init__(self, independentVariables, dependentVariables, groupName, dataFile, loadData = True):
+  def __init__(self, independentVariables, dependentVariables, groupName, dataFile, loadData = True, lazy = False):
     XSILData.__init__(self, independentVariables, dependentVariables)
     self.filename = os.path.split(dataFile)[1]
     self.groupName = groupName
+    self.hdf5File = None
+    
+    if loadData and lazy: self.mapDataFile(groupName, dataFile)
+    elif loadData: self.parseDataFile(groupName, dataFile)
+  
+  def mapDataFile(self, groupName, dataFile):
+    """
+    Make each variable's array the h5py dataset for that variable, which only reads
+    the parts of the dataset that are sliced. The file is opened when the first
+    variable is accessed, and stays open until `close` is called.
+    """
+    def loader(variable):
+      if not self.hdf5File:
+        require_h5py()
+        self.hdf5File = h5py.File(dataFile, 'r')
+      return self.hdf5File[groupName][variable['name']]
     
-    if loadData: self.parseDataFile(groupName, dataFile)
+    for variable in self.independentVariables + self.dependentVariables:
+      variable.loader = loader
   
   def parseDataFile(self, groupName, dataFile):
     require_h5py()
     f = h5py.File(dataFile, 'r')
     
-    subgroup = f[groupName]
-    
-    for independentVariable in self.independentVariables:
-      independentVariable['array'] = subgroup[independentVariable['name']].value
-    
-    for dependentVariable in self.dependentVariables:
-      dependentVariable['array'] = subgroup[dependentVariable['name']].value
+    try:
+      subgroup = f[groupName]
+      
+      for independentVariable in self.independentVariables:
+        independentVariable['array'] = subgroup[independentVariable['name']].value
+      
+      for dependentVariable in self.dependentVariables:
+        dependentVariable['array'] = subgroup[dependentVariable['name']].value
+    finally:
+      f.close()
     
     # Now wasn't that easy.
   
+  def close(self):
+    XSILData.close(self)
+    if self.hdf5File:
+      self.hdf5File.close()
+      self.hdf5File = None
+  
 
 
 class XSILObject(object):
@@ -172,7 +270,7 @@ class XSILObject(object):
 
 
 class XSILFile(object):
-  def __init__(self, filename, loadData=True):
+  def __init__(self, filename, loadData=True, lazy=False):
     """Create an `XSILFile` object.
     `filename` is the filename of the XSIL file, and `loadData` specifies whether or not the
     data in the XSIL file should be loaded (if not, just the metadata is loaded).
@@ -183,6 +281,13 @@ class XSILFile(object):
     - ``'ascii'``: load only data stored in ASCII format
     - ``'binary'``: load only data stored in binary format
     - ``'hdf5'``: load only data stored in HDF5 format
+    
+    If `lazy` is true, binary and HDF5 data isn't read until the ``'array'`` of a variable
+    is first accessed. Binary data is then a read-only `numpy.memmap`, and HDF5 data is an
+    h5py dataset, so that slicing them only reads the part of the file that is needed.
+    ASCII data is always read when the file is opened. The HDF5 files stay open until
+    `close` is called, which happens automatically when the `XSILFile` is used in a
+    ``with`` statement.
     """
     if not isinstance(loadData, basestring):
       # loadData is True or False
@@ -220,8 +325,8 @@ class XSILFile(object):
       
       # We do str(name) here to convert unicode objects to str objects
       # It seems that numpy doesn't like unicode strings.
-      independentVariables = [{'name': str(name)} for name in variableNames[0:nIndependentVariables]]
-      dependentVariables = [{'name': str(name)} for name in variableNames[nIndependentVariables:]]
+      independentVariables = [XSILVariable(name=str(name)) for name in variableNames[0:nIndependentVariables]]
+      dependentVariables = [XSILVariable(name=str(name)) for name in variableNames[nIndependentVariables:]]
       
       assert len(dependentVariables) == nDependentVariables
       
@@ -251,7 +356,7 @@ class XSILFile(object):
         loadBinaryData = False
         if loadData in ['all', 'binary']: loadBinaryData = True
         data = XSILDataBinary(independentVariables, dependentVariables, uLong, precision, encoding, filename,
-                                    loadData = loadBinaryData)
+                                    loadData = loadBinaryData, lazy = lazy)
       elif format == 'Text':
         dataString = None
         if loadData in ['all', 'ascii']: dataString = streamElement.innerText().strip()
@@ -263,10 +368,182 @@ class XSILFile(object):
         objectFilename = streamElement.innerText().strip()
         filename = os.path.join(os.path.split(filename)[0], objectFilename)
         groupName = metalinkElement.getAttribute('Group').strip()
-        data = XSILDataHDF5(independentVariables, dependentVariables, groupName, filename, loadData = loadHDFData)
+        data = XSILDataHDF5(independentVariables, dependentVariables, groupName, filename, loadData = loadHDFData, lazy = lazy)
       
       self.xsilObjects.append(XSILObject(xsilName, data))
     
   
+  def close(self):
+    """
+    Close the files opened to load data lazily. Arrays that were loaded lazily must not be
+    used after this, but accessing a variable's ``'array'`` again loads it again.
+    """
+    for xsilObject in self.xsilObjects:
+      if xsilObject.data:
+        xsilObject.data.close()
+  
+  def __enter__(self):
+    return self
+  
+  def __exit__(self, excType, excValue, traceback):
+    self.close()
+    return False
+  
+  
+
+
+# Below are unit tests for loading the data of XSIL files. These tests can be executed by
+# directly executing this file, or by running the xpdeint test suite from 'run_tests.py'
+
+class AbstractXSILFileTests(unittest.TestCase):
+  independentVariables = [('x', 2), ('y', 3), ('z', 4)]
+  dependentVariables = ['dens', 'phiR', 'phiI']
+  
+  def setUp(self):
+    require_numpy()
+    self.directory = tempfile.mkdtemp()
+    self.independentArrays = [numpy.linspace(-1.0, 1.0, length) + varNum for varNum, (name, length) in enumerate(self.independentVariables)]
+    shape = tuple(length for name, length in self.independentVariables)
+    self.dependentArrays = [numpy.arange(numpy.prod(shape), dtype=numpy.float64).reshape(shape) * (varNum + 1.5) - varNum
+                              for varNum in range(len(self.dependentVariables))]
+  
+  def tearDown(self):
+    shutil.rmtree(self.directory)
+  
+  def writeXSILFile(self, streamContents):
+    names = [name for name, length in self.independentVariables] + self.dependentVariables
+    dims = ''.join('    <Dim>%i</Dim>\n' % length for name, length in self.independentVariables)
+    filename = os.path.join(self.directory, 'test.xsil')
+    with open(filename, 'w') as f:
+      f.write('''<?xml version="1.0" encoding="UTF-8"?>
+<simulation xmds-version="2">
+<XSIL Name="moment_group_1">
+  <Param Name="n_independent">%(independentCount)i</Param>
+  <Array Name="variables" Type="Text">
+    <Dim>%(variableCount)i</Dim>
+    <Stream><Metalink Format="Text" Delimiter=" \\n"/>
+%(names)s 
+    </Stream>
+  </Array>
+  <Array Name="data" Type="double">
+%(dims)s    <Dim>%(variableCount)i</Dim>
+    <Stream>%(streamContents)s
+    </Stream>
+  </Array>
+</XSIL>
+</simulation>
+''' % dict(independentCount = len(self.independentVariables), variableCount = len(names),
+             names = ' '.join(names), dims = dims, streamContents = streamContents))
+    return filename
+  
+  def assertDataEqual(self, xsilFile):
+    self.assertEqual(len(xsilFile.xsilObjects), 1)
+    xsilObject = xsilFile.xsilObjects[0]
+    self.assertEqual([v['name'] for v in xsilObject.independentVariables], [name for name, length in self.independentVariables])
+    self.assertEqual([v['name'] for v in xsilObject.dependentVariables], self.dependentVariables)
+    for variable, expected in zip(xsilObject.independentVariables + xsilObject.dependentVariables,
+                                  self.independentArrays + self.dependentArrays):
+      array = numpy.asarray(variable['array'][...])
+      self.assertEqual(array.shape, expected.shape)
+      self.assertTrue(numpy.array_equal(array, expected), "Variable '%s' differs" % variable['name'])
+  
+  def loadedData(self, filename, lazy):
+    xsilFile = XSILFile(filename, lazy = lazy)
+    try:
+      self.assertDataEqual(xsilFile)
+    finally:
+      xsilFile.close()
+  
+
+class BinaryXSILFileTests(AbstractXSILFileTests):
+  def setUp(self):
+    AbstractXSILFileTests.setUp(self)
+    with open(os.path.join(self.directory, 'test.dat'), 'wb') as f:
+      for array in self.independentArrays + self.dependentArrays:
+        numpy.array([array.size], dtype='<u8').tofile(f)
+        array.astype('<f8').tofile(f)
+    self.filename = self.writeXSILFile(
+      '<Metalink Format="Binary" UnsignedLong="uint64" precision="double" Type="Remote" Encoding="LittleEndian"/>\ntest.dat'
+    )
+  
+  def test_eager(self):
+    self.loadedData(self.filename, lazy = False)
+  
+  def test_lazy(self):
+    self.loadedData(self.filename, lazy = True)
+  
+  def test_lazyIsMemoryMapped(self):
+    with XSILFile(self.filename, lazy = True) as xsilFile:
+      self.assertTrue(isinstance(xsilFile.xsilObjects[0].dependentVariables[1]['array'], numpy.memmap))
+  
+
+class HDF5XSILFileTests(AbstractXSILFileTests):
+  def setUp(self):
+    try:
+      require_h5py()
+    except ImportError:
+      self.skipTest("h5py isn't available")
+    AbstractXSILFileTests.setUp(self)
+    with h5py.File(os.path.join(self.directory, 'test.h5'), 'w') as f:
+      group = f.create_group('1')
+      for (name, length), array in zip(self.independentVariables, self.independentArrays):
+        group.create_dataset(name, data=array)
+      for name, array in zip(self.dependentVariables, self.dependentArrays):
+        group.create_dataset(name, data=array)
+    self.filename = self.writeXSILFile('<Metalink Format="HDF5" Type="Remote" Group="/1"/>\ntest.h5')
+  
+  def test_eager(self):
+    self.loadedData(self.filename, lazy = False)
+  
+  def test_lazy(self):
+    self.loadedData(self.filename, lazy = True)
+  
+  def test_closeClosesFile(self):
+    with XSILFile(self.filename, lazy = True) as xsilFile:
+      data = xsilFile.xsilObjects[0].data
+      self.assertTrue(data.hdf5File is None)
+      self.assertTrue(isinstance(xsilFile.xsilObjects[0].dependentVariables[0]['array'], h5py.Dataset))
+      hdf5File = data.hdf5File
+      self.assertTrue(hdf5File)
+    self.assertTrue(data.hdf5File is None)
+    self.assertFalse(hdf5File)
+    # The data is loaded again if it is used after the file is closed
+    self.assertDataEqual(xsilFile)
+    xsilFile.close()
+  
+
+class ASCIIXSILFileTests(AbstractXSILFileTests):
+  def setUp(self):
+    AbstractXSILFileTests.setUp(self)
+    rows = []
+    for index in numpy.ndindex(*self.dependentArrays[0].shape):
+      row = [array[i] for array, i in zip(self.independentArrays, index)] + [array[index] for array in self.dependentArrays]
+      rows.append(' '.join('%.17e' % value for value in row))
+    self.dataString = '\n'.join(rows)
+    self.filename = self.writeXSILFile('<Metalink Format="Text" Delimiter=" \\n"/>\n' + self.dataString)
+  
+  def rowByRowArrays(self):
+    # The arrays produced by parsing the table one row at a time, which is how ASCII data used to be loaded
+    varCount = len(self.independentVariables) + len(self.dependentVariables)
+    independentGeometry = [length for name, length in self.independentVariables]
+    lines = self.dataString.splitlines()
+    result = numpy.empty((len(lines), varCount))
+    for lineNumber, line in enumerate(lines):
+      result[lineNumber, :] = numpy.fromstring(line, numpy.float64, sep=' ')
+    return [numpy.unique(result[:, varNum]) for varNum in range(len(independentGeometry))] \
+         + [result[:, varNum].reshape(*independentGeometry) for varNum in range(len(independentGeometry), varCount)]
+  
+  def test_load(self):
+    self.loadedData(self.filename, lazy = False)
+  
+  def test_matchesRowByRow(self):
+    xsilFile = XSILFile(self.filename)
+    xsilObject = xsilFile.xsilObjects[0]
+    for variable, expected in zip(xsilObject.independentVariables + xsilObject.dependentVariables, self.rowByRowArrays()):
+      self.assertEqual(variable['array'].shape, expected.shape)
+      self.assertTrue(numpy.array_equal(variable['array'], expected), "Variable '%s' differs" % variable['name'])
+  
 
+if __name__ == '__main__':
+  unittest.main()
 
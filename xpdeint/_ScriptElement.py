@@ -28,6 +28,7 @@ from Cheetah.Template import Template
 from xpdeint.ParserException import ParserException
 
 from xpdeint.Utilities import lazy_property
+from xpdeint.TransformCalibration import transformCostsForThisMachine
 
 class _ScriptElement (Template):
   class LoopingOrder(object):
@@ -423,8 +424,26 @@ class _ScriptElement (Template):
     transformMultiplier = self.getVar('features')['TransformMultiplexer']
     return transformMultiplier.basesNeeded.index(basis)
   
+  @property
+  def transformCosts(self):
+    """
+    The per-point costs of the basic operations used by the transform path search,
+    either measured by `xmds2 --calibrate-transforms` or the heuristic defaults.
+    """
+    return transformCostsForThisMachine(self.getVar('dataCache'))
+  
+  def transformBatchesForVectors(self, vectors):
+    """Return the transform batches all of whose vectors are in `vectors`."""
+    batches = []
+    for vector in vectors:
+      batch = vector.transformBatch
+      if batch and not batch in batches and all([v in vectors for v in batch['vectors']]):
+        batches.append(batch)
+    return batches
+  
   def transformVectorsToBasis(self, vectors, basis):
     result = []
+    batches = self.transformBatchesForVectors(vectors)
     for vector in vectors:
       if not vector.needsTransforms:
         continue
@@ -437,7 +456,13 @@ class _ScriptElement (Template):
         )
       basisString = ', '.join(vectorBasis)
       basisIndex = self.basisIndexForBasis(vectorBasis)
-      result.extend([vector.functions['basisTransform'].call(new_basis=basisIndex), ' // (', basisString, ')\n'])
+      transformFunction = vector.functions['basisTransform']
+      if vector.transformBatch in batches:
+        # The whole batch is transformed together at the position of its first vector
+        if not vector is vector.transformBatch['vectors'][0]:
+          continue
+        transformFunction = vector.transformBatch['function']
+      result.extend([transformFunction.call(new_basis=basisIndex), ' // (', basisString, ')\n'])
     return ''.join(result)
   
   def registerVectorsRequiredInBasis(self, vectors, basis):
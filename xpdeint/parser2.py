@@ -39,6 +39,8 @@ import cPickle
 
 from xpdeint.Preferences import xpdeintUserDataPath
 
+xpdeintDataCachePath = os.path.join(xpdeintUserDataPath, 'xpdeint_cache')
+
 # Import the parser stuff
 from xpdeint.ParserException import ParserException, parserWarning
 from xpdeint.XMDS2Parser import XMDS2Parser
@@ -56,6 +58,7 @@ from xpdeint._ScriptElement import _ScriptElement
 
 # Import the Configuration module
 from xpdeint import Configuration
+from xpdeint import TransformCalibration
 
 # The help message printed when --help is used as an argument
 help_message = '''
@@ -69,6 +72,12 @@ Options and arguments:
                                   file, not the .xmds file. Implies --verbose. Mostly useful when debuging xmds
                                   code generation.
 -n                              : Only generate a source file, don't compile (also --no-compile)
+--no-build-cache                : Always compile the simulation, even if an identical build is in the build cache
+--plan-wisdom                   : Compile the simulation and run only its FFTW planning phase to save wisdom for later runs
+--fftw-plan rigour              : Override the FFTW plan rigour (estimate, measure, patient or exhaustive) when
+                                  planning with --plan-wisdom
+--calibrate-transforms          : Measure the cost of transforms on this machine and use the measured costs
+                                  when choosing how to transform vectors between bases
 --configure                     : Run configuration checks for compiling simulations
 --reconfigure                   : Run configuration using the same options as used with the last
                                   time --configure was run with the additional arguments specified
@@ -113,6 +122,87 @@ def degsOutput(err, globalNameSpace):
   else:
     print >> sys.stderr, "Unknown element. Please report this error to %s" % globalNameSpace['bugReportAddress']
 
+def reconfigureIfNeeded():
+  """
+  Reconfigure xmds2 if the configuration script has changed since xmds2 was last configured.
+  """
+  wscript_path = resource_filename(__name__, 'support/wscript')
+  wscript_userdata_path = os.path.join(xpdeintUserDataPath, 'wscript')
+  waf_build_cache_path = os.path.join(xpdeintUserDataPath, 'waf_configure/c4che/_cache.py')
+  
+  if not os.path.isfile(wscript_userdata_path) or \
+    fileContentsHash(wscript_userdata_path) != fileContentsHash(wscript_path) or \
+    not os.path.exists(waf_build_cache_path):
+    print "Reconfiguring xmds2 (updated config script)..."
+    
+    Configuration.run_reconfig()
+
+def loadDataCache(debug = False):
+  """
+  Load the xmds2 data cache (a dictionary of expensive-to-compute values kept between runs).
+  """
+  dataCache = {}
+  if os.path.isfile(xpdeintDataCachePath):
+    try:
+      try:
+        import mpmath
+        mpmath.mp.prec = 128
+      except ImportError, err:
+        pass
+      dataCacheFile = open(xpdeintDataCachePath, 'rb')
+      dataCache = cPickle.load(dataCacheFile)
+      dataCacheFile.close()
+      del dataCacheFile
+    except Exception, err:
+      print >> sys.stderr, "Warning: Unable to load xmds2 data cache."
+      if debug: raise
+  
+  if dataCache.get('version', 0) != DATA_CACHE_VERSION:
+    dataCache.clear()
+    dataCache['version'] = DATA_CACHE_VERSION
+  
+  return dataCache
+
+def saveDataCache(dataCache):
+  if not dataCache: return
+  try:
+    dataCacheFile = file(xpdeintDataCachePath, 'w')
+  except IOError, err:
+    print >> sys.stderr, "Warning: Unable to write xmds2 data cache. " \
+                         "Ensure '%(xpdeintUserDataPath)s' exists and is writable." % globals()
+  else:
+    cPickle.dump(dataCache, dataCacheFile, protocol = 2)
+    dataCacheFile.close()
+
+def runPlanningPhase(targetName, variant, fftwPlan = None, hasPlans = True):
+  """
+  Run the compiled simulation `targetName` only until its FFTW transforms have been planned
+  so that the wisdom is saved for later runs of this (or any similar) simulation.
+  """
+  if not hasPlans:
+    print "... done. This simulation has no FFTW transforms to plan. Type './%s' to run." % targetName
+    return 0
+  
+  environment = dict(os.environ)
+  environment['XMDS_PLAN_WISDOM'] = '1'
+  if fftwPlan:
+    environment['XMDS_FFTW_PLAN'] = fftwPlan
+  
+  if variant == 'mpi':
+    # The plans for distributed transforms depend on the number of processes
+    print "... done. Plans for MPI simulations depend on the number of processes, so run"
+    print "  XMDS_PLAN_WISDOM=1 mpirun -np <processes> ./%s" % targetName
+    print "to save wisdom for this simulation."
+    return 0
+  
+  print "Planning transforms..."
+  result = subprocess.call([os.path.join(os.path.curdir, targetName)], env = environment)
+  if result == 0:
+    print "... done. Type './%s' to run." % targetName
+  else:
+    print "\n\nFATAL ERROR: Planning the transforms failed."
+  return result
+
 class Usage(Exception):
   """
   Exception class used when an error occurs parsing command
@@ -134,6 +224,9 @@ def main(argv=None):
   degs = False
   
   compileScript = True
+  useBuildCache = True
+  planWisdom = False
+  fftwPlan = None
   noVersionInformation = False
   
   # Import version information
@@ -160,6 +253,10 @@ def main(argv=None):
                       "verbose",
                       "help",
                       "no-compile",
+                      "no-build-cache",
+                      "calibrate-transforms",
+                      "plan-wisdom",
+                      "fftw-plan=",
                       "output=",
                       "no-version",
                       "configure",
@@ -178,6 +275,7 @@ def main(argv=None):
     libPaths = []
     run_config = False
     run_reconfig = False
+    calibrateTransforms = False
     
     sourceFilename = None
     # option processing
@@ -196,6 +294,16 @@ def main(argv=None):
         sourceFilename = value
       elif option in ("-n", "--no-compile"):
         compileScript = False
+      elif option == "--no-build-cache":
+        useBuildCache = False
+      elif option == "--calibrate-transforms":
+        calibrateTransforms = True
+      elif option == "--plan-wisdom":
+        planWisdom = True
+      elif option == "--fftw-plan":
+        fftwPlan = value.strip().lower()
+        if not fftwPlan in ['estimate', 'measure', 'patient', 'exhaustive']:
+          raise Usage("The FFTW plan rigour must be one of 'estimate', 'measure', 'patient' or 'exhaustive'.")
       elif option == "--no-version":
         # This option is here for the test suite so that the generated source files don't
         # contain version information. This makes it easier to check if the source for a script
@@ -216,6 +324,17 @@ def main(argv=None):
     elif run_reconfig or includePaths or libPaths:
       return Configuration.run_reconfig(includePaths, libPaths)
     
+    if planWisdom and not compileScript:
+      raise Usage("--plan-wisdom can't be used with --no-compile.")
+    
+    if calibrateTransforms:
+      reconfigureIfNeeded()
+      dataCache = loadDataCache(debug)
+      result = TransformCalibration.run_calibration(dataCache, verbose)
+      if result == 0:
+        saveDataCache(dataCache)
+      return result
+    
     # argument processing
     if len(args) == 1:
         scriptName = args[0]
@@ -227,16 +346,7 @@ def main(argv=None):
     print >> sys.stderr, "\t for help use --help"
     return 2
   
-  wscript_path = resource_filename(__name__, 'support/wscript')
-  wscript_userdata_path = os.path.join(xpdeintUserDataPath, 'wscript')
-  waf_build_cache_path = os.path.join(xpdeintUserDataPath, 'waf_configure/c4che/_cache.py')
-  
-  if not os.path.isfile(wscript_userdata_path) or \
-    fileContentsHash(wscript_userdata_path) != fileContentsHash(wscript_path) or \
-    not os.path.exists(waf_build_cache_path):
-    print "Reconfiguring xmds2 (updated config script)..."
-    
-    Configuration.run_reconfig()
+  reconfigureIfNeeded()
   
   # globalNameSpace is a dictionary of variables that are available in all
   # templates
@@ -307,27 +417,7 @@ def main(argv=None):
   globalNameSpace['simulationUselib'] = set()
   globalNameSpace['bugReportAddress'] = 'xmds-devel@lists.sourceforge.net'
   
-  xpdeintDataCachePath = os.path.join(xpdeintUserDataPath, 'xpdeint_cache')
-  dataCache = {}
-  if os.path.isfile(xpdeintDataCachePath):
-    try:
-      try:
-        import mpmath
-        mpmath.mp.prec = 128
-      except ImportError, err:
-        pass
-      dataCacheFile = open(xpdeintDataCachePath, 'rb')
-      dataCache = cPickle.load(dataCacheFile)
-      dataCacheFile.close()
-      del dataCacheFile
-    except Exception, err:
-      print >> sys.stderr, "Warning: Unable to load xmds2 data cache."
-      if debug: raise
-  globalNameSpace['dataCache'] = dataCache
-  
-  if dataCache.get('version', 0) != DATA_CACHE_VERSION:
-    dataCache.clear()
-    dataCache['version'] = DATA_CACHE_VERSION
+  globalNameSpace['dataCache'] = loadDataCache(debug)
   
   # We need the anyObject function in a few templates, so
   # we add it to the globalNameSpace, so that the function can
@@ -421,16 +511,7 @@ def main(argv=None):
     
     return -1
   
-  dataCache = globalNameSpace['dataCache']
-  if dataCache:
-    try:
-      dataCacheFile = file(xpdeintDataCachePath, 'w')
-    except IOError, err:
-      print >> sys.stderr, "Warning: Unable to write xmds2 data cache. " \
-                           "Ensure '%(xpdeintUserDataPath)s' exists and is writable." % locals()
-    else:
-      cPickle.dump(dataCache, dataCacheFile, protocol = 2)
-      dataCacheFile.close()
+  saveDataCache(globalNameSpace['dataCache'])
   
   
   # Now actually write the simulation to disk.
@@ -475,11 +556,32 @@ def main(argv=None):
   assert len(variant) == 1
   
   if compileScript:
+      targetName = sourceFilename[:-3] # strip of trailing '.cc'
+      
+      # If this exact simulation has been compiled before with the same configuration,
+      # reuse the binary from the build cache instead of compiling it again.
+      buildCacheKey = None
+      hasPlans = bool(globalNameSpace['features']['TransformMultiplexer'].planningTransforms)
+      
+      if useBuildCache:
+        buildCacheKey = Configuration.build_cache_key(
+          sourceFilename,
+          variant = anyObject(variant),
+          buildKWs = buildKWs,
+          userCFlags = userCFlags
+        )
+        if Configuration.fetch_cached_build(buildCacheKey, targetName):
+          print "Reusing previously compiled simulation from the build cache."
+          if planWisdom:
+            return runPlanningPhase(targetName, anyObject(variant), fftwPlan, hasPlans)
+          print "... done. Type './%s' to run." % globalNameSpace['simulationName']
+          return 0
+      
       print "Compiling simulation..."
     
       result = Configuration.run_build(
         sourceFilename,
-        sourceFilename[:-3], # strip of trailing '.cc'
+        targetName,
         variant = anyObject(variant),
         buildKWs = buildKWs,
         verbose = verbose,
@@ -487,6 +589,10 @@ def main(argv=None):
       )
       
       if result == 0:
+        if buildCacheKey:
+          Configuration.store_cached_build(buildCacheKey, targetName)
+        if planWisdom:
+          return runPlanningPhase(targetName, anyObject(variant), fftwPlan, hasPlans)
         print "... done. Type './%s' to run." % globalNameSpace['simulationName']
       else:
         print "\n\nFATAL ERROR: Failed to compile. Check warnings and errors. The most important will be first."
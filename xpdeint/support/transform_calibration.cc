@@ -0,0 +1,214 @@
+/*
+ * transform_calibration.cc
+ * Copyright (C) 2026, the xmds team. All rights reserved.
+ *
+ * Benchmark used by 'xmds2 --calibrate-transforms' to measure the cost of the
+ * operations available to the transform path search on this machine.
+ *
+ * Each line of output is the name of an operation followed by the time in seconds
+ * that it takes per unit of work.  The units match the heuristic cost estimates
+ * used by xpdeint:
+ *   copy, inPlaceMultiply, outOfPlaceMultiply: per complex point
+ *   complexFFT, realFFT:                       per complex point per ceil(ln N)
+ *   realMatrixMultiply, complexMatrixMultiply: per complex point per matrix element
+ *
+*/
+
+#include <complex>
+#include <cmath>
+#include <cstdio>
+#include <cstdlib>
+#include <cstring>
+#include <sys/time.h>
+
+#include <fftw3.h>
+
+#if   defined(CBLAS_MKL)
+  #include <mkl.h>
+  #define HAVE_CBLAS
+#elif defined(CBLAS_VECLIB)
+  #include <Accelerate/Accelerate.h>
+  #define HAVE_CBLAS
+#elif defined(CBLAS_ATLAS)
+  extern "C" {
+    #include <cblas.h>
+  }
+  #define HAVE_CBLAS
+#elif defined(CBLAS_GSL)
+  #include <gsl/gsl_cblas.h>
+  #define HAVE_CBLAS
+#endif
+
+using namespace std;
+
+typedef complex<double> complex_t;
+
+// Number of complex points in each benchmark array.  This is large enough to
+// be out of the L1/L2 caches, like the vectors of a typical simulation.
+static const long _points = 1 << 18;
+// Minimum time for one timing trial
+static const double _min_trial_time = 0.05;
+static const int _trials = 5;
+
+static complex_t *_in;
+static complex_t *_out;
+
+static double wall_time()
+{
+  struct timeval tv;
+  gettimeofday(&tv, NULL);
+  return tv.tv_sec + 1e-6 * tv.tv_usec;
+}
+
+struct Operation {
+  virtual ~Operation() {}
+  virtual void run() = 0;
+};
+
+// Return the best-of-several time in seconds for a single execution of `op`.
+static double time_operation(Operation &op)
+{
+  double best = 1e300;
+  op.run();
+  for (int trial = 0; trial < _trials; trial++) {
+    long repeats = 0;
+    double start = wall_time(), elapsed;
+    do {
+      op.run();
+      repeats++;
+      elapsed = wall_time() - start;
+    } while (elapsed < _min_trial_time);
+    if (elapsed / repeats < best)
+      best = elapsed / repeats;
+  }
+  return best;
+}
+
+struct Copy : Operation {
+  void run() {
+    for (long i = 0; i < _points; i++)
+      _out[i] = _in[i];
+  }
+};
+
+struct InPlaceMultiply : Operation {
+  void run() {
+    for (long i = 0; i < _points; i++)
+      _in[i] *= 1.0000001;
+  }
+};
+
+struct OutOfPlaceMultiply : Operation {
+  void run() {
+    for (long i = 0; i < _points; i++)
+      _out[i] = _in[i] * 0.9999999;
+  }
+};
+
+struct FFTWPlan : Operation {
+  fftw_plan plan;
+  ~FFTWPlan() { fftw_destroy_plan(plan); }
+  void run() { fftw_execute(plan); }
+};
+
+// Transform sizes used for the FFT and matrix benchmarks.
+static const int _sizes[] = {16, 64, 256, 1024};
+static const int _size_count = sizeof(_sizes) / sizeof(_sizes[0]);
+
+static double fft_cost(bool complex_transform)
+{
+  double total = 0.0;
+  for (int s = 0; s < _size_count; s++) {
+    int n = _sizes[s];
+    FFTWPlan op;
+    if (complex_transform) {
+      int howmany = _points / n;
+      op.plan = fftw_plan_many_dft(1, &n, howmany,
+                                   reinterpret_cast<fftw_complex*>(_in), NULL, 1, n,
+                                   reinterpret_cast<fftw_complex*>(_out), NULL, 1, n,
+                                   FFTW_FORWARD, FFTW_MEASURE);
+    } else {
+      // Complex vectors are transformed by r2r transforms as pairs of real numbers
+      int howmany = 2 * _points / n;
+      fftw_r2r_kind kind = FFTW_REDFT10;
+      op.plan = fftw_plan_many_r2r(1, &n, howmany,
+                                   reinterpret_cast<double*>(_in), NULL, 1, n,
+                                   reinterpret_cast<double*>(_out), NULL, 1, n,
+                                   &kind, FFTW_MEASURE);
+    }
+    total += time_operation(op) / (_points * ceil(log((double)n)));
+  }
+  return total / _size_count;
+}
+
+#ifdef HAVE_CBLAS
+struct MatrixMultiply : Operation {
+  bool complex_matrix;
+  int n;
+  long inner;
+  void *matrix;
+
+  void run() {
+    if (complex_matrix) {
+      const complex_t alpha = 1.0, beta = 0.0;
+      cblas_zgemm(CblasRowMajor, CblasNoTrans, CblasNoTrans, n, inner, n,
+                  &alpha, matrix, n, _in, inner, &beta, _out, inner);
+    } else {
+      // A real matrix acts on complex data as pairs of real numbers
+      cblas_dgemm(CblasRowMajor, CblasNoTrans, CblasNoTrans, n, 2 * inner, n,
+                  1.0, (double*)matrix, n, (double*)_in, 2 * inner, 0.0, (double*)_out, 2 * inner);
+    }
+  }
+};
+
+static double matrix_cost(bool complex_matrix)
+{
+  double total = 0.0;
+  for (int s = 0; s < _size_count; s++) {
+    MatrixMultiply op;
+    op.complex_matrix = complex_matrix;
+    op.n = _sizes[s];
+    op.inner = _points / op.n;
+    size_t matrix_size = (complex_matrix ? sizeof(complex_t) : sizeof(double)) * op.n * op.n;
+    op.matrix = fftw_malloc(matrix_size);
+    memset(op.matrix, 0, matrix_size);
+    for (int i = 0; i < op.n; i++) {
+      if (complex_matrix)
+        ((complex_t*)op.matrix)[i * op.n + i] = 1.0;
+      else
+        ((double*)op.matrix)[i * op.n + i] = 1.0;
+    }
+    total += time_operation(op) / ((double)_points * op.n);
+    fftw_free(op.matrix);
+  }
+  return total / _size_count;
+}
+#endif
+
+int main()
+{
+  _in  = (complex_t*) fftw_malloc(sizeof(complex_t) * _points);
+  _out = (complex_t*) fftw_malloc(sizeof(complex_t) * _points);
+  for (long i = 0; i < _points; i++) {
+    _in[i] = complex_t(1.0 / (i + 1), 0.5 / (i + 1));
+    _out[i] = 0.0;
+  }
+
+  Copy copy;
+  InPlaceMultiply inPlaceMultiply;
+  OutOfPlaceMultiply outOfPlaceMultiply;
+
+  printf("copy %e\n", time_operation(copy) / _points);
+  printf("inPlaceMultiply %e\n", time_operation(inPlaceMultiply) / _points);
+  printf("outOfPlaceMultiply %e\n", time_operation(outOfPlaceMultiply) / _points);
+  printf("complexFFT %e\n", fft_cost(true));
+  printf("realFFT %e\n", fft_cost(false));
+#ifdef HAVE_CBLAS
+  printf("realMatrixMultiply %e\n", matrix_cost(false));
+  printf("complexMatrixMultiply %e\n", matrix_cost(true));
+#endif
+
+  fftw_free(_in);
+  fftw_free(_out);
+  return 0;
+}